@@ -1,8 +1,8 @@
-from database import DatabaseManager
+from database import get_db
 import os
 
 print("Creating Database Backup...")
-db = DatabaseManager()
+db = get_db()
 success, path = db.export_miroir("c:\\GICA_PROJET\\backups")
 if success:
     print(f"Backup created successfully at: {path}")
@@ -0,0 +1,37 @@
+"""
+Profile maintenance scripts against an in-memory copy of the database.
+
+Usage: python bench_scripts.py script [script ...]
+    e.g. python bench_scripts.py fix_chronology debug_stock_issue dump_mv
+
+Each script is run as __main__. The database (resolved like the application,
+GICA_DB env var included) is copied into RAM first and both db_utils.get_conn()
+and get_db()/get_logic() use that copy, so nothing is written back to the
+real file.
+"""
+
+import cProfile
+import pstats
+import runpy
+import sys
+
+from db_utils import get_db_path, load_in_memory
+
+
+def bench(scripts, top=15):
+    print(f"Loading {get_db_path()} into memory...")
+    load_in_memory()
+
+    for script in scripts:
+        module_name = script[:-3] if script.endswith(".py") else script
+        print(f"\n=== {module_name} ===")
+        profiler = cProfile.Profile()
+        profiler.runcall(runpy.run_module, module_name, run_name="__main__")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(top)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    bench(sys.argv[1:])
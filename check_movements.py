@@ -1,10 +1,8 @@
-import sqlite3
+from db_utils import get_conn
 
-DB_PATH = "gestion_commerciale.db"
 
 def check_movements():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = get_conn(read_only=True)
     cursor = conn.cursor()
     
     print("Checking Movements for Product ID 24:")
@@ -16,7 +14,6 @@ def check_movements():
             print(dict(row))
     else:
         print("No movements for Product 24.")
-    conn.close()
 
 if __name__ == "__main__":
     check_movements()
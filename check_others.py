@@ -1,10 +1,8 @@
-import sqlite3
+from db_utils import get_conn
 
-DB_PATH = "gestion_commerciale.db"
 
 def check_others():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = get_conn(read_only=True)
     cursor = conn.cursor()
     
     print("Checking Products for None code:")
@@ -25,7 +23,6 @@ def check_others():
     else:
         print("No clients with None/Empty code.")
         
-    conn.close()
 
 if __name__ == "__main__":
     check_others()
@@ -1,14 +1,12 @@
 
-import sqlite3
+from db_utils import get_conn, get_db_path
 import os
 
-db_path = "gestion_commerciale.db"
-if not os.path.exists(db_path):
+if not os.path.exists(get_db_path()):
     print("DB not found")
     exit()
 
-conn = sqlite3.connect(db_path)
-conn.row_factory = sqlite3.Row
+conn = get_conn(read_only=True)
 cursor = conn.cursor()
 
 print("--- Products & Parent Stock ---")
@@ -22,5 +20,3 @@ for p in products:
         parent_info = f"{p['parent_stock_id']} ({parent['nom'] if parent else 'NOT FOUND'})"
         
     print(f"ID: {p['id']}, Nom: {p['nom']}, Parent: {parent_info}, Stock: {p['stock_actuel']}")
-
-conn.close()
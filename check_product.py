@@ -1,10 +1,8 @@
-import sqlite3
+from db_utils import get_conn
 
-DB_PATH = "gestion_commerciale.db"
 
 def check_product():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = get_conn(read_only=True)
     cursor = conn.cursor()
     
     print("Checking Product ID 12:")
@@ -14,7 +12,6 @@ def check_product():
         print(dict(row))
     else:
         print("Product 12 not found")
-    conn.close()
 
 if __name__ == "__main__":
     check_product()
@@ -1,8 +1,8 @@
 import sqlite3
-from database import DatabaseManager
+from database import get_db
 
 def check_products():
-    db = DatabaseManager()
+    db = get_db()
     conn = db._get_connection()
     cursor = conn.cursor()
     
@@ -1,12 +1,8 @@
 
-import sqlite3
-import pandas as pd
-
-DB_PATH = r"C:\GICA_PROJET\gestion_commerciale.db"
+from db_utils import get_conn
 
 def check_stock():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = get_conn(read_only=True)
     cursor = conn.cursor()
 
     print("--- DIAGNOSTIC STOCK ---")
@@ -57,7 +53,6 @@ def check_stock():
                  print(f"       >>> BUG: Receptions Table ({real_receptions}) != Stock Movements Receptions ({total_in})")
 
     print("-" * 80)
-    conn.close()
 
 if __name__ == "__main__":
     check_stock()
@@ -8,7 +8,7 @@ import os
 import hashlib
 import configparser
 from datetime import datetime
-from typing import Optional, List, Dict, Any, Tuple
+from typing import Optional, List, Dict, Any, Tuple, Iterator
 
 
 # ==================================================================================
@@ -226,6 +226,100 @@ MASTER_SCHEMA = {
 }
 
 
+# ==================================================================================
+# MASTER INDEXES - Index definitions applied by the Self-Healing process
+# ==================================================================================
+# Format : "nom_index": "table(colonnes) [WHERE condition]"
+# Les index manquants sont créés au démarrage (CREATE INDEX IF NOT EXISTS), puis ANALYZE.
+# ==================================================================================
+
+MASTER_INDEXES = {
+    # Etat 104 (get_client_sales_summary): covering partial index, date range -> client -> HT
+    "idx_factures_active_date_client": "factures(date_facture, client_id, montant_ht, statut) WHERE statut != 'Annulée'",
+    # Documents of a client over a period (balances, recouvrement, client statements):
+    # covering, the amounts are read from the index without a table lookup
+    "idx_factures_client_date_type": "factures(client_id, date_facture, type_document, statut, montant_ttc)",
+    # Payments of a client over a period (balances, client statements), covering
+    "idx_paiements_client_date_montant": "paiements(client_id, date_paiement, montant)",
+    # Avoirs lookups by original invoice (has_avoir, remaining due, refund status, validate_avoir_amount)
+    "idx_factures_origine_type_ttc": "factures(facture_origine_id, type_document, statut, montant_ttc)",
+    # Last transport info per chauffeur (get_last_transport_info_by_chauffeur)
+    "idx_factures_chauffeur_created": "factures(chauffeur, created_at DESC)",
+    "idx_receptions_chauffeur_created": "receptions(chauffeur, created_at DESC)",
+    # Stock movement of a given document (reception/facture -> product)
+    "idx_mv_doc_type_prod": "stock_movements(document_id, type_mouvement, product_id)",
+    # Latest receptions per product
+    "idx_recep_prod_created": "receptions(product_id, created_at DESC)",
+    # Stock receptions of a product over a period (stock valuation)
+    "idx_recep_prod_lieu_date": "receptions(product_id, lieu_livraison, date_reception)",
+    # Lines of an invoice (invoice detail, per-invoice quantity/unit, report joins from factures)
+    "idx_lignes_facture_facture": "lignes_facture(facture_id)",
+    # Lines of a product (per-product sales over a period)
+    "idx_lignes_facture_product": "lignes_facture(product_id, facture_id)",
+    # Payments by status (pending payments for a bordereau)
+    "idx_paiements_statut": "paiements(statut)",
+    # Movements of a product (recalculate_global_stock SUM, stock history)
+    "idx_mv_product": "stock_movements(product_id)",
+    # Movements over a date range (audit report)
+    "idx_mv_created_at": "stock_movements(created_at)",
+    # Children of a parent product (partial: most products have no parent)
+    "idx_products_parent": "products(parent_stock_id) WHERE parent_stock_id IS NOT NULL"
+}
+
+
+# ==================================================================================
+# HOT-PATH SQL - Fixed statement texts so sqlite3's per-connection statement cache hits
+# ==================================================================================
+
+# Size of the sqlite3 prepared-statement cache (Python default is 128)
+CACHED_STATEMENTS = 256
+
+# SQLite page cache per connection, in KiB (SQLite default is 2000)
+PAGE_CACHE_KIB = 20000
+
+_SEL_STOCK_TARGET_SQL = """
+    SELECT p.parent_stock_id, p.code_produit, p.nom,
+           COALESCE(pa.id, p.id) AS target_id,
+           CASE WHEN pa.id IS NOT NULL THEN pa.stock_actuel ELSE p.stock_actuel END AS target_stock
+    FROM products p
+    LEFT JOIN products pa ON pa.id = p.parent_stock_id
+    WHERE p.id = ?
+"""
+
+# Same lookup for several products (log_stock_movements_bulk)
+_SEL_STOCK_TARGETS_SQL = """
+    SELECT p.id, p.parent_stock_id, p.code_produit, p.nom,
+           COALESCE(pa.id, p.id) AS target_id,
+           CASE WHEN pa.id IS NOT NULL THEN pa.stock_actuel ELSE p.stock_actuel END AS target_stock
+    FROM products p
+    LEFT JOIN products pa ON pa.id = p.parent_stock_id
+    WHERE p.id IN ({placeholders})
+"""
+
+_INS_MOUVEMENT_SQL = """
+    INSERT INTO stock_movements 
+    (product_id, type_mouvement, quantite, reference_document,
+     document_id, stock_avant, stock_apres, created_by, date_mouvement)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_UPD_STOCK_SQL = "UPDATE products SET stock_actuel = ? WHERE id = ?"
+
+_INS_LIGNE_SQL = """
+    INSERT INTO lignes_facture 
+    (facture_id, product_id, quantite, prix_unitaire, montant)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+_INS_PAIEMENT_SQL = """
+    INSERT INTO paiements 
+    (numero, date_paiement, client_id, facture_id, montant,
+     mode_paiement, reference, banque, contrat_num, 
+     contrat_date_debut, contrat_date_fin, created_by)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
 class DatabaseManager:
     """Manages SQLite database connections and operations"""
     
@@ -233,11 +327,42 @@ class DatabaseManager:
     # We now prefer config.ini
     DEFAULT_DB_PATH = r"C:\GICA_PROJET\gestion_commerciale.db"
 
+    # Rows pulled per fetchmany() call by the iter_* (streaming) readers
+    FETCH_BATCH_SIZE = 1000
+
+    # VACUUM only when free pages exceed this fraction of the file
+    VACUUM_FREE_RATIO = 0.3
+
     def __init__(self, db_path: str = None):
-        # 1. Try to load from Config File
-        config_path = "config.ini"
-        loaded_path = None
+        # Priority: Constructor Arg > Config File > Default Constant
+        self.db_path = self.resolve_db_path(db_path)
+            
+        self.connection: Optional[sqlite3.Connection] = None
+        
+        # Ensure directory exists (none for ':memory:' or a bare file name)
+        db_dir = os.path.dirname(self.db_path)
+        if self.db_path != ":memory:" and db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        
+        # Start Self-Healing Process
+        self.verifier_et_reparer_base_de_donnees()
+
+    @classmethod
+    def resolve_db_path(cls, db_path: str = None) -> str:
+        """
+        Resolve the database file path without opening it.
+        Priority: Explicit Arg > GICA_DB env var > config.ini [DATABASE] path > DEFAULT_DB_PATH
+        """
+        if db_path is not None:
+            return db_path
+        
+        # Environment override (scripts, tests, ':memory:')
+        env_path = os.environ.get("GICA_DB", "").strip()
+        if env_path:
+            return env_path if env_path == ":memory:" else os.path.abspath(env_path)
         
+        # Try to load from Config File
+        config_path = "config.ini"
         if os.path.exists(config_path):
              config = configparser.ConfigParser()
              try:
@@ -245,34 +370,29 @@ class DatabaseManager:
                  if 'DATABASE' in config and 'path' in config['DATABASE']:
                      candidate = config['DATABASE']['path'].strip()
                      if candidate:
-                         loaded_path = os.path.abspath(candidate)
+                         return os.path.abspath(candidate)
              except Exception as e:
                  print(f"[Warning] Could not read config.ini: {e}")
-
-        # 2. Priority: Constructor Arg > Config File > Default Constant
-        if db_path is not None:
-            self.db_path = db_path
-        elif loaded_path is not None:
-             self.db_path = loaded_path
-        else:
-            self.db_path = self.DEFAULT_DB_PATH
-            
-        self.connection: Optional[sqlite3.Connection] = None
-        
-        # Ensure directory exists
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         
-        # Start Self-Healing Process
-        self.verifier_et_reparer_base_de_donnees()
+        return cls.DEFAULT_DB_PATH
 
     def _get_connection(self) -> sqlite3.Connection:
-        """Get or create database connection with WAL mode enabled"""
+        """
+        Get or create database connection with WAL mode enabled.
+        row_factory is always sqlite3.Row: callers must not set it again.
+        """
         if self.connection is None:
-            self.connection = sqlite3.connect(self.db_path)
+            self.connection = sqlite3.connect(self.db_path, cached_statements=CACHED_STATEMENTS)
             self.connection.execute("PRAGMA foreign_keys = ON")
+            # Keep the working set of the yearly reports in memory between queries
+            self.connection.execute(f"PRAGMA cache_size = -{PAGE_CACHE_KIB}")
+            # GROUP BY / ORDER BY temp b-trees of the reports stay in RAM
+            self.connection.execute("PRAGMA temp_store = MEMORY")
             # Enable Write-Ahead Logging for concurrency
             self.connection.execute("PRAGMA journal_mode=WAL;") 
             self.connection.row_factory = sqlite3.Row
+            # Connection-private scratch table for id lists (fixed SQL instead of IN (?,?,...))
+            self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS _batch_ids (id INTEGER PRIMARY KEY)")
         return self.connection
     
     def verifier_et_reparer_base_de_donnees(self):
@@ -314,7 +434,25 @@ class DatabaseManager:
                             cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {col_name} {col_def}")
                         except sqlite3.OperationalError as e:
                             print(f"[Error] Could not add column {col_name} to {table_name}: {e}")
-        
+
+        # 3. Check for missing indexes
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='index'")
+        existing_indexes = {row['name'] for row in cursor.fetchall()}
+        indexes_created = False
+
+        for index_name, index_def in MASTER_INDEXES.items():
+            if index_name not in existing_indexes:
+                print(f"[Self-Healing] Creating missing index: {index_name}")
+                try:
+                    cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {index_def}")
+                    indexes_created = True
+                except sqlite3.OperationalError as e:
+                    print(f"[Error] Could not create index {index_name}: {e}")
+
+        # Refresh planner statistics once so the new indexes are actually picked
+        if indexes_created:
+            cursor.execute("ANALYZE")
+
         conn.commit()
         self._initialize_default_data()
         print("[System] Database Self-Healing Complete.")
@@ -380,6 +518,29 @@ class DatabaseManager:
 
 
     
+    def _iter_rows(self, cursor: sqlite3.Cursor) -> Iterator[Dict[str, Any]]:
+        """Yield rows of an executed cursor as dicts, FETCH_BATCH_SIZE rows at a time"""
+        while True:
+            rows = cursor.fetchmany(self.FETCH_BATCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(row)
+
+    def _checkpoint_and_compact(self):
+        """
+        Fold the WAL back into the main file after a large write, and VACUUM
+        only if enough pages were freed to make it worth it.
+        Must be called outside of any open transaction.
+        """
+        conn = self._get_connection()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        total_pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        if total_pages and free_pages / total_pages > self.VACUUM_FREE_RATIO:
+            conn.execute("VACUUM")
+
     def close(self):
         """Close database connection"""
         if self.connection:
@@ -678,6 +839,41 @@ class DatabaseManager:
         row = cursor.fetchone()
         return dict(row) if row else None
     
+    def get_products_tva(self, product_ids) -> Dict[int, float]:
+        """Get {product_id: tva} for several products in one query"""
+        ids = list(set(product_ids))
+        if not ids:
+            return {}
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT id, tva FROM products WHERE id IN ({','.join('?' * len(ids))})", ids)
+        return {row['id']: row['tva'] for row in cursor.fetchall()}
+    
+    def get_stocks_for_products(self, product_ids) -> Dict[int, Dict[str, Any]]:
+        """
+        Get {product_id: {'nom', 'tva', 'stock_actuel', 'is_parent'}} for several products in one query.
+        stock_actuel is the effective stock: the parent's when the product is linked to one.
+        """
+        ids = list(set(product_ids))
+        if not ids:
+            return {}
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT p.id, p.nom, p.tva,
+                   COALESCE(parent.stock_actuel, p.stock_actuel) AS stock_actuel,
+                   EXISTS(SELECT 1 FROM products c
+                          WHERE c.parent_stock_id = p.id AND c.id != p.id) AS is_parent
+            FROM products p
+            LEFT JOIN products parent ON parent.id = p.parent_stock_id
+            WHERE p.id IN ({','.join('?' * len(ids))})
+        """, ids)
+        return {row['id']: {'nom': row['nom'],
+                            'tva': row['tva'],
+                            'stock_actuel': row['stock_actuel'],
+                            'is_parent': bool(row['is_parent'])}
+                for row in cursor.fetchall()}
+    
     def update_product_price(self, product_id: int, nouveau_prix: float, 
                            reference_note: str = None, date_note: str = None,
                            date_application: str = None, created_by: int = None):
@@ -920,25 +1116,29 @@ class DatabaseManager:
         conn = self._get_connection()
         cursor = conn.cursor()
         
-        # Query both tables, prioritizing by Date
+        # One indexed LIMIT 1 lookup per table, newest row wins (compared in Python)
         cursor.execute("""
             SELECT matricule_tracteur, matricule_remorque, transporteur, created_at 
-            FROM (
-                SELECT matricule_tracteur, matricule_remorque, transporteur, created_at 
-                FROM factures 
-                WHERE chauffeur = ? AND chauffeur != ''
-                
-                UNION ALL
-                
-                SELECT matricule as matricule_tracteur, matricule_remorque, transporteur, created_at 
-                FROM receptions 
-                WHERE chauffeur = ? AND chauffeur != ''
-            )
+            FROM factures 
+            WHERE chauffeur = ? AND chauffeur != ''
             ORDER BY created_at DESC
             LIMIT 1
-        """, (chauffeur, chauffeur))
+        """, (chauffeur,))
+        from_facture = cursor.fetchone()
+        
+        cursor.execute("""
+            SELECT matricule as matricule_tracteur, matricule_remorque, transporteur, created_at 
+            FROM receptions 
+            WHERE chauffeur = ? AND chauffeur != ''
+            ORDER BY created_at DESC
+            LIMIT 1
+        """, (chauffeur,))
+        from_reception = cursor.fetchone()
+        
+        row = from_facture
+        if from_reception and (not row or (from_reception[3] or '') > (row[3] or '')):
+            row = from_reception
         
-        row = cursor.fetchone()
         if row:
             return {
                 'matricule_tracteur': row[0],
@@ -953,11 +1153,7 @@ class DatabaseManager:
         conn = self._get_connection()
         cursor = conn.cursor()
         montant = quantite * prix_unitaire
-        cursor.execute("""
-            INSERT INTO lignes_facture 
-            (facture_id, product_id, quantite, prix_unitaire, montant)
-            VALUES (?, ?, ?, ?, ?)
-        """, (facture_id, product_id, quantite, prix_unitaire, montant))
+        cursor.execute(_INS_LIGNE_SQL, (facture_id, product_id, quantite, prix_unitaire, montant))
         conn.commit()
     
     def update_facture_totals(self, facture_id: int, montant_ht: float,
@@ -973,8 +1169,13 @@ class DatabaseManager:
         conn.commit()
     
     def get_all_factures(self, client_id: int = None, annee: int = None,
-                        type_document: str = None) -> List[Dict[str, Any]]:
-        """Get all invoices"""
+                        type_document: str = None, limit: int = None) -> List[Dict[str, Any]]:
+        """Get all invoices (most recent first, at most `limit` if given)"""
+        return list(self.iter_all_factures(client_id, annee, type_document, limit))
+
+    def iter_all_factures(self, client_id: int = None, annee: int = None,
+                          type_document: str = None, limit: int = None) -> Iterator[Dict[str, Any]]:
+        """Stream all invoices (same rows as get_all_factures) in fetchmany batches"""
         conn = self._get_connection()
         cursor = conn.cursor()
         query = """
@@ -1000,8 +1201,11 @@ class DatabaseManager:
             params.append(type_document)
         
         query += " ORDER BY f.created_at DESC"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
         cursor.execute(query, params)
-        return [dict(row) for row in cursor.fetchall()]
+        yield from self._iter_rows(cursor)
     
     def get_facture_by_id(self, facture_id: int) -> Optional[Dict[str, Any]]:
         """Get invoice by ID with line items"""
@@ -1034,6 +1238,10 @@ class DatabaseManager:
     
     def get_invoice_details_by_date_range(self, start_date: str, end_date: str) -> List[Dict[str, Any]]:
         """Get flattened invoice details (lines) within date range"""
+        return list(self.iter_invoice_details_by_date_range(start_date, end_date))
+
+    def iter_invoice_details_by_date_range(self, start_date: str, end_date: str) -> Iterator[Dict[str, Any]]:
+        """Stream flattened invoice details (lines) within date range in fetchmany batches"""
         conn = self._get_connection()
         cursor = conn.cursor()
         
@@ -1054,15 +1262,20 @@ class DatabaseManager:
                 l.montant as montant_ht,
                 f.statut,
                 f.type_document,
-                (SELECT COUNT(*) FROM factures WHERE facture_origine_id = f.id AND type_document = 'Avoir' AND statut != 'Annulée') > 0 as has_avoir
+                (av.facture_origine_id IS NOT NULL) as has_avoir
             FROM lignes_facture l
             JOIN factures f ON l.facture_id = f.id
             JOIN products p ON l.product_id = p.id
+            LEFT JOIN (
+                SELECT facture_origine_id FROM factures
+                WHERE type_document = 'Avoir' AND statut != 'Annulée'
+                GROUP BY facture_origine_id
+            ) av ON av.facture_origine_id = f.id
             WHERE f.date_facture BETWEEN ? AND ?
             ORDER BY f.date_facture DESC, f.numero DESC
         """, (start_date, end_date))
         
-        return [dict(row) for row in cursor.fetchall()]
+        yield from self._iter_rows(cursor)
     
     def get_client_sales_summary(self, start_date: str, end_date: str) -> List[Dict[str, Any]]:
         """Get sales aggregated by client for Etat 104"""
@@ -1144,8 +1357,8 @@ class DatabaseManager:
                        facture_id: int = None, reference: str = None,
                        banque: str = None, contrat_num: str = None,
                        contrat_date_debut: str = None, contrat_date_fin: str = None,
-                       created_by: int = None) -> int:
-        """Create new payment"""
+                       created_by: int = None, commit: bool = True) -> int:
+        """Create new payment (commit=False leaves the transaction open for the caller)"""
         conn = self._get_connection()
         cursor = conn.cursor()
         
@@ -1154,23 +1367,19 @@ class DatabaseManager:
         count = cursor.fetchone()[0] + 1
         numero = f"PAY-{count:06d}"
         
-        cursor.execute("""
-            INSERT INTO paiements 
-            (numero, date_paiement, client_id, facture_id, montant,
-             mode_paiement, reference, banque, contrat_num, 
-             contrat_date_debut, contrat_date_fin, created_by)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (numero, date_paiement, client_id, facture_id, montant,
-              mode_paiement, reference, banque, contrat_num,
-              contrat_date_debut, contrat_date_fin, created_by))
+        cursor.execute(_INS_PAIEMENT_SQL, (
+            numero, date_paiement, client_id, facture_id, montant,
+            mode_paiement, reference, banque, contrat_num,
+            contrat_date_debut, contrat_date_fin, created_by))
         
         paiement_id = cursor.lastrowid
-        conn.commit()
+        if commit:
+            conn.commit()
         return paiement_id
     
     def get_all_paiements(self, client_id: int = None, 
-                         statut: str = None) -> List[Dict[str, Any]]:
-        """Get all payments"""
+                         statut: str = None, limit: int = None) -> List[Dict[str, Any]]:
+        """Get all payments (most recent first, at most `limit` if given)"""
         conn = self._get_connection()
         cursor = conn.cursor()
         query = """
@@ -1191,6 +1400,9 @@ class DatabaseManager:
             query += " AND p.statut = ?"
             params.append(statut)
         query += " ORDER BY p.created_at DESC"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
         cursor.execute(query, params)
         return [dict(row) for row in cursor.fetchall()]
     
@@ -1211,30 +1423,32 @@ class DatabaseManager:
     def log_stock_movement(self, product_id: int, type_mouvement: str,
                           quantite: float, reference_document: str = None,
                           document_id: int = None, created_by: int = None,
-                          date_mouvement: str = None):
-        """Log stock movement"""
+                          date_mouvement: str = None, commit: bool = True):
+        """Log stock movement (commit=False: the caller commits its own transaction)"""
         conn = self._get_connection()
         cursor = conn.cursor()
         
         # Check if product has a parent (Physical Stock)
         # If so, the movement logs against the PARENT to maintain accurate physical inventory.
-        cursor.execute("SELECT parent_stock_id, code_produit, nom FROM products WHERE id = ?", (product_id,))
+        # Single lookup: the parent row is joined so we get the TARGET stock in the same query.
+        cursor.execute(_SEL_STOCK_TARGET_SQL, (product_id,))
         res = cursor.fetchone()
-        
+
         target_product_id = product_id
         final_ref = reference_document
-        
-        if res and res['parent_stock_id']:
-            target_product_id = res['parent_stock_id']
-            # Append child info to reference for traceability
-            child_info = res['code_produit'] or res['nom']
-            addon = f" (Via {child_info})"
-            final_ref = (final_ref or "") + addon
+        stock_avant = 0.0
+
+        if res:
+            target_product_id = res['target_id']
+            if res['target_stock'] is not None:
+                stock_avant = res['target_stock']
+
+            if res['parent_stock_id']:
+                # Append child info to reference for traceability
+                child_info = res['code_produit'] or res['nom']
+                addon = f" (Via {child_info})"
+                final_ref = (final_ref or "") + addon
 
-        # Get current stock of TARGET
-        cursor.execute("SELECT stock_actuel FROM products WHERE id = ?", (target_product_id,))
-        result = cursor.fetchone()
-        stock_avant = result[0] if result and result[0] is not None else 0.0
         stock_apres = stock_avant + quantite
         
         # If date_mouvement not provided, use existing logic (created_at will be used by DB default if not set? 
@@ -1245,20 +1459,65 @@ class DatabaseManager:
             date_mouvement = datetime.now().strftime("%Y-%m-%d")
 
         # Log movement
-        cursor.execute("""
-            INSERT INTO stock_movements 
-            (product_id, type_mouvement, quantite, reference_document,
-             document_id, stock_avant, stock_apres, created_by, date_mouvement)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (target_product_id, type_mouvement, quantite, final_ref,
-              document_id, stock_avant, stock_apres, created_by, date_mouvement))
+        cursor.execute(_INS_MOUVEMENT_SQL, (
+            target_product_id, type_mouvement, quantite, final_ref,
+            document_id, stock_avant, stock_apres, created_by, date_mouvement))
         
         # Update product stock
-        cursor.execute("""
-            UPDATE products SET stock_actuel = ? WHERE id = ?
-        """, (stock_apres, target_product_id))
+        cursor.execute(_UPD_STOCK_SQL, (stock_apres, target_product_id))
         
-        conn.commit()
+        if commit:
+            conn.commit()
+    
+    def log_stock_movements_bulk(self, movements: List[Tuple], commit: bool = True):
+        """
+        Log several stock movements at once, same rules as log_stock_movement
+        (child -> parent stock, running stock_avant/stock_apres in list order).
+        movements: [(product_id, type_mouvement, quantite, reference_document,
+                     document_id, created_by, date_mouvement), ...]
+        """
+        if not movements:
+            return
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        
+        # Stock targets of all products in one query
+        ids = list({m[0] for m in movements})
+        cursor.execute(_SEL_STOCK_TARGETS_SQL.format(placeholders=",".join("?" * len(ids))), ids)
+        targets = {row['id']: row for row in cursor.fetchall()}
+        
+        today = datetime.now().strftime("%Y-%m-%d")
+        running = {}
+        movement_rows = []
+        for product_id, type_mouvement, quantite, reference_document, document_id, created_by, date_mouvement in movements:
+            res = targets.get(product_id)
+            target_product_id = product_id
+            final_ref = reference_document
+            stock_avant = 0.0
+            
+            if res:
+                target_product_id = res['target_id']
+                if target_product_id not in running:
+                    running[target_product_id] = res['target_stock'] if res['target_stock'] is not None else 0.0
+                stock_avant = running[target_product_id]
+                
+                if res['parent_stock_id']:
+                    child_info = res['code_produit'] or res['nom']
+                    final_ref = (final_ref or "") + f" (Via {child_info})"
+            
+            stock_apres = stock_avant + quantite
+            if res:
+                running[target_product_id] = stock_apres
+            
+            movement_rows.append((
+                target_product_id, type_mouvement, quantite, final_ref,
+                document_id, stock_avant, stock_apres, created_by, date_mouvement or today))
+        
+        cursor.executemany(_INS_MOUVEMENT_SQL, movement_rows)
+        cursor.executemany(_UPD_STOCK_SQL, [(stock, pid) for pid, stock in running.items()])
+        
+        if commit:
+            conn.commit()
     
     def get_stock_movements(self, product_id: int = None) -> List[Dict[str, Any]]:
         """Get stock movements"""
@@ -1277,46 +1536,88 @@ class DatabaseManager:
             cursor.execute(query + " ORDER BY s.created_at DESC")
         return [dict(row) for row in cursor.fetchall()]
     
+    def get_recent_stock_movements(self, per_product: int = 5) -> Dict[int, List[Dict[str, Any]]]:
+        """Get {product_id: [last `per_product` movements, most recent first]} in one query"""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT * FROM (
+                SELECT s.*, p.nom as product_nom, u.full_name as created_by_name,
+                       ROW_NUMBER() OVER (PARTITION BY s.product_id
+                                          ORDER BY s.created_at DESC, s.id) AS rn
+                FROM stock_movements s
+                JOIN products p ON s.product_id = p.id
+                LEFT JOIN users u ON s.created_by = u.id
+            )
+            WHERE rn <= ?
+            ORDER BY product_id, rn
+        """, (per_product,))
+        movements = {}
+        for row in cursor.fetchall():
+            movement = dict(row)
+            del movement['rn']
+            movements.setdefault(movement['product_id'], []).append(movement)
+        return movements
+    
     # ==================== BORDEREAU OPERATIONS ====================
     
-    def create_bordereau(self, date_bordereau: str, banque: str,
-                        paiement_ids: List[int], created_by: int = None) -> int:
-        """Create bank voucher"""
+    def create_bordereau(self, date_bordereau: Optional[str], banque: str,
+                        paiement_ids: List[int], created_by: int = None) -> Optional[int]:
+        """
+        Create bank voucher (date_bordereau=None dates it today, local time)
+        Returns None (nothing written) if any of the payments is not 'En attente'
+        """
         conn = self._get_connection()
         cursor = conn.cursor()
         
-        # Generate numero
-        cursor.execute("SELECT COUNT(*) FROM bordereaux")
-        count = cursor.fetchone()[0] + 1
-        numero = f"BOR-{count:04d}"
-        
-        # Calculate total
-        placeholders = ','.join('?' * len(paiement_ids))
-        cursor.execute(f"""
-            SELECT SUM(montant) FROM paiements WHERE id IN ({placeholders})
-        """, paiement_ids)
-        montant_total = cursor.fetchone()[0] or 0.0
-        
-        # Create bordereau
-        cursor.execute("""
-            INSERT INTO bordereaux 
-            (numero, date_bordereau, banque, montant_total, 
-             nombre_paiements, created_by)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (numero, date_bordereau, banque, montant_total, 
-              len(paiement_ids), created_by))
-        
-        bordereau_id = cursor.lastrowid
-        
-        # Update payment status
-        cursor.execute(f"""
-            UPDATE paiements 
-            SET statut = 'Déposé', bordereau_id = ?
-            WHERE id IN ({placeholders})
-        """, [bordereau_id] + paiement_ids)
-        
-        conn.commit()
-        return bordereau_id
+        try:
+            # Write lock from the start: numero and payment statuses can't change under us
+            conn.execute("BEGIN IMMEDIATE")
+            
+            # Generate numero
+            cursor.execute("SELECT COUNT(*) FROM bordereaux")
+            count = cursor.fetchone()[0] + 1
+            numero = f"BOR-{count:04d}"
+            
+            # Load the selected ids into the scratch table (statement text is fixed whatever the count)
+            cursor.execute("DELETE FROM _batch_ids")
+            cursor.executemany("INSERT OR IGNORE INTO _batch_ids (id) VALUES (?)",
+                               [(pid,) for pid in paiement_ids])
+            
+            # Calculate total
+            cursor.execute("""
+                SELECT SUM(p.montant) FROM paiements p JOIN _batch_ids b ON b.id = p.id
+            """)
+            montant_total = cursor.fetchone()[0] or 0.0
+            
+            # Create bordereau
+            cursor.execute("""
+                INSERT INTO bordereaux 
+                (numero, date_bordereau, banque, montant_total, 
+                 nombre_paiements, created_by)
+                VALUES (?, COALESCE(?, date('now', 'localtime')), ?, ?, ?, ?)
+            """, (numero, date_bordereau, banque, montant_total, 
+                  len(paiement_ids), created_by))
+            
+            bordereau_id = cursor.lastrowid
+            
+            # Update payment status: only pending payments move, all of them or nothing
+            cursor.execute("""
+                UPDATE paiements 
+                SET statut = 'Déposé', bordereau_id = ?
+                WHERE id IN (SELECT id FROM _batch_ids) AND statut = 'En attente'
+            """, (bordereau_id,))
+            
+            if cursor.rowcount != len(set(paiement_ids)):
+                conn.rollback()
+                return None
+            
+            cursor.execute("DELETE FROM _batch_ids")
+            conn.commit()
+            return bordereau_id
+        except Exception as e:
+            conn.rollback()
+            raise e
     
     def get_all_bordereaux(self) -> List[Dict[str, Any]]:
         """Get all bank vouchers"""
@@ -1383,8 +1684,10 @@ class DatabaseManager:
             VALUES (?, ?, ?, ?, ?)
         """, (annee, date_cloture, json.dumps(stocks), json.dumps(soldes), created_by))
         
+        cloture_id = cursor.lastrowid
         conn.commit()
-        return cursor.lastrowid
+        self._checkpoint_and_compact()
+        return cloture_id
     
     def get_cloture_by_annee(self, annee: int) -> Optional[Dict[str, Any]]:
         """Get closure by year"""
@@ -1452,10 +1755,13 @@ class DatabaseManager:
             # I will NOT re-insert default products to strictly follow "remettre a zero".
             
             conn.commit()
-            return True
         except Exception as e:
             conn.rollback()
             raise e
+        
+        # Large DELETEs leave a big WAL and many free pages behind
+        self._checkpoint_and_compact()
+        return True
 
 # Global database instance
 _db_instance: Optional[DatabaseManager] = None
@@ -0,0 +1,124 @@
+"""
+Shared SQLite connection for maintenance / inspection scripts
+(debug_*, dump_*, inspect_*, fix_* ...).
+
+The connection is opened once per process and reused by every script
+imported in that process, with the pragmas tuned for bulk reads/writes.
+
+Set GICA_PROFILE=1 to trace every statement and print the slowest ones
+(with their query plan) when the script exits.
+"""
+
+import atexit
+import os
+import sqlite3
+import time
+from typing import Optional, List, Tuple
+
+import database
+from database import DatabaseManager
+
+_conn: Optional[sqlite3.Connection] = None
+
+# GICA_PROFILE=1: (sql, start, duration) per traced statement
+_trace: List[List] = []
+
+
+def get_db_path() -> str:
+    """Database file used by the scripts (same resolution as the application)"""
+    return DatabaseManager.resolve_db_path()
+
+
+def get_conn(read_only: bool = False) -> sqlite3.Connection:
+    """
+    Get (or open once) the shared script connection.
+    read_only=True (inspection scripts) turns on query_only so a stray write fails.
+    """
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(get_db_path())
+        _conn.row_factory = sqlite3.Row
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute("PRAGMA temp_store=MEMORY")
+        _conn.execute("PRAGMA cache_size=-65536")  # 64 MB page cache
+        _conn.execute("PRAGMA mmap_size=268435456")  # 256 MB memory-mapped reads
+        if os.environ.get("GICA_PROFILE") == "1":
+            _install_profiler(_conn)
+    _conn.execute(f"PRAGMA query_only={'ON' if read_only else 'OFF'}")
+    return _conn
+
+
+def load_in_memory() -> sqlite3.Connection:
+    """
+    Copy the database into RAM and make it both the shared script connection
+    and the get_db() instance (so get_logic() uses it too).
+    Must run before get_db()/get_logic() are first called.
+    Changes made by the scripts afterwards are never written back to disk.
+    """
+    global _conn
+    db = DatabaseManager(":memory:")
+    memory = db._get_connection()
+    source = sqlite3.connect(get_db_path())
+    source.backup(memory)
+    source.close()
+    if _conn is not None:
+        _conn.close()
+    if os.environ.get("GICA_PROFILE") == "1":
+        _install_profiler(memory)
+    database._db_instance = db
+    _conn = memory
+    return _conn
+
+
+def explain(conn: sqlite3.Connection, sql: str, params=()) -> None:
+    """Print the EXPLAIN QUERY PLAN of a query (index usage check)"""
+    for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params):
+        print(f"  {row[3]}")
+
+
+# ==================================================================================
+# PROFILING (GICA_PROFILE=1)
+# ==================================================================================
+
+def _close_last_trace(now: float) -> None:
+    if _trace and _trace[-1][2] is None:
+        _trace[-1][2] = now - _trace[-1][1]
+
+
+def _on_statement(sql: str) -> None:
+    # A statement's duration runs until the next one starts, so it includes
+    # fetching its rows and the Python work done on them.
+    now = time.perf_counter()
+    _close_last_trace(now)
+    _trace.append([sql, now, None])
+
+
+def _install_profiler(conn: sqlite3.Connection) -> None:
+    conn.set_trace_callback(_on_statement)
+    atexit.register(print_profile, conn)
+
+
+def print_profile(conn: sqlite3.Connection, top: int = 10) -> None:
+    """Print the slowest traced statements (total time per SQL text) with their plan"""
+    conn.set_trace_callback(None)
+    _close_last_trace(time.perf_counter())
+    if not _trace:
+        return
+
+    totals = {}
+    for sql, _, duration in _trace:
+        stats = totals.setdefault(sql, [0.0, 0])
+        stats[0] += duration
+        stats[1] += 1
+    slowest: List[Tuple[str, List]] = sorted(totals.items(), key=lambda item: item[1][0], reverse=True)[:top]
+
+    print(f"\n=== GICA_PROFILE: {len(_trace)} statements, top {len(slowest)} by time ===")
+    for sql, (total, count) in slowest:
+        print(f"{total * 1000:9.2f} ms  x{count:<5} {' '.join(sql.split())[:200]}")
+        if sql.lstrip().upper().startswith(("SELECT", "WITH")):
+            try:
+                explain(conn, sql)
+            except sqlite3.Error:
+                pass
+    _trace.clear()
@@ -1,12 +1,9 @@
 
-import sqlite3
-from datetime import datetime
-
-DB_PATH = "gestion_commerciale.db"
+from database import get_db
 
 def inspect_data():
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_db()._get_connection()
         cursor = conn.cursor()
 
         print("--- RECENT AUDIT LOGS (Clients) ---")
@@ -14,7 +11,7 @@ def inspect_data():
             cursor.execute("SELECT * FROM audit_logs WHERE action LIKE '%client%' ORDER BY timestamp DESC LIMIT 5")
             logs = cursor.fetchall()
             for log in logs:
-                print(log)
+                print(tuple(log))
         except Exception as e:
             print(f"Error reading logs: {e}")
 
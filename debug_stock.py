@@ -1,14 +1,11 @@
 
-import sqlite3
-import os
+from database import get_db
 
-db_path = "gestion_commerciale.db"
-conn = sqlite3.connect(db_path)
-conn.row_factory = sqlite3.Row
+conn = get_db()._get_connection()
 cursor = conn.cursor()
 
 # Find product
-cursor.execute("SELECT * FROM products WHERE nom LIKE '%Vrac%'")
+cursor.execute("SELECT * FROM products WHERE nom LIKE ?", ("%Vrac%",))
 product = cursor.fetchone()
 
 if product:
@@ -29,5 +26,3 @@ if product:
         print(dict(r))
 else:
     print("Product 'Vrac CRS' not found")
-
-conn.close()
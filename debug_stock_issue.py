@@ -1,16 +1,14 @@
 
-import sqlite3
 import os
-
-DB_PATH = r"C:\GICA_PROJET\gestion_commerciale.db"
+from itertools import groupby
+from db_utils import get_conn, get_db_path
 
 def inspect_product_and_receptions(product_name_part):
-    if not os.path.exists(DB_PATH):
-        print(f"Database not found at {DB_PATH}")
+    if not os.path.exists(get_db_path()):
+        print(f"Database not found at {get_db_path()}")
         return
 
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = get_conn(read_only=True)
     cursor = conn.cursor()
 
     print(f"Searching for products matching: '{product_name_part}'")
@@ -21,6 +19,41 @@ def inspect_product_and_receptions(product_name_part):
         print("No products found.")
         return
 
+    def placeholders(values):
+        return ",".join("?" * len(values))
+
+    # Chargement groupé : parents, réceptions et mouvements en 3 requêtes
+    product_ids = [p['id'] for p in products]
+    parent_ids = list({p['parent_stock_id'] for p in products if p['parent_stock_id']})
+
+    parents_by_id = {}
+    if parent_ids:
+        cursor.execute(f"SELECT * FROM products WHERE id IN ({placeholders(parent_ids)})", parent_ids)
+        parents_by_id = {row['id']: row for row in cursor.fetchall()}
+
+    cursor.execute(f"""
+        SELECT * FROM receptions WHERE product_id IN ({placeholders(product_ids)})
+        ORDER BY product_id, created_at DESC, id
+    """, product_ids)
+    receptions_by_product = {
+        pid: list(rows)[:5]
+        for pid, rows in groupby(cursor.fetchall(), key=lambda r: r['product_id'])
+    }
+
+    movements = {}
+    reception_ids = [r['id'] for rows in receptions_by_product.values() for r in rows]
+    if reception_ids:
+        movement_product_ids = product_ids + parent_ids
+        cursor.execute(f"""
+            SELECT * FROM stock_movements
+            WHERE type_mouvement = 'Réception'
+              AND document_id IN ({placeholders(reception_ids)})
+              AND product_id IN ({placeholders(movement_product_ids)})
+            ORDER BY id
+        """, reception_ids + movement_product_ids)
+        for mv in cursor.fetchall():
+            movements.setdefault((mv['document_id'], mv['product_id']), mv)
+
     for p in products:
         print(f"\n--- Product: {p['nom']} (ID: {p['id']}) ---")
         print(f"  Code: {p['code_produit']}")
@@ -29,29 +62,25 @@ def inspect_product_and_receptions(product_name_part):
         print(f"  Parent ID: {p['parent_stock_id']}")
         
         if p['parent_stock_id']:
-            cursor.execute("SELECT * FROM products WHERE id = ?", (p['parent_stock_id'],))
-            parent = cursor.fetchone()
+            parent = parents_by_id.get(p['parent_stock_id'])
             if parent:
                 print(f"  -> Parent: {parent['nom']} (ID: {parent['id']}), Stock: {parent['stock_actuel']}")
             else:
                 print(f"  -> Parent ID {p['parent_stock_id']} NOT FOUND!")
 
         print("\n  Recent Receptions:")
-        cursor.execute("SELECT * FROM receptions WHERE product_id = ? ORDER BY created_at DESC LIMIT 5", (p['id'],))
-        receptions = cursor.fetchall()
+        receptions = receptions_by_product.get(p['id'], [])
         for r in receptions:
             print(f"    - ID: {r['id']}, Num: {r['numero']}, Date: {r['date_reception']}, Qté Reçue: {r['quantite_recue']}, Lieu: {r['lieu_livraison']}")
             
             # Check for stock movements for this reception
-            cursor.execute("SELECT * FROM stock_movements WHERE document_id = ? AND type_mouvement = 'Réception' AND product_id = ?", (r['id'], p['id']))
-            mv = cursor.fetchone()
+            mv = movements.get((r['id'], p['id']))
             if mv:
                 print(f"      [Movement Found] ID: {mv['id']}, Qté: {mv['quantite']}, Stock Après: {mv['stock_apres']}")
             else:
                  # Check if movement is on parent
                 if p['parent_stock_id']:
-                     cursor.execute("SELECT * FROM stock_movements WHERE document_id = ? AND type_mouvement = 'Réception' AND product_id = ?", (r['id'], p['parent_stock_id']))
-                     mv_parent = cursor.fetchone()
+                     mv_parent = movements.get((r['id'], p['parent_stock_id']))
                      if mv_parent:
                          print(f"      [Movement Found on Parent] ID: {mv_parent['id']}, Qté: {mv_parent['quantite']}, Stock Après: {mv_parent['stock_apres']}")
                      else:
@@ -59,7 +88,5 @@ def inspect_product_and_receptions(product_name_part):
                 else:
                     print("      [WARNING] No Stock Movement found!")
 
-    conn.close()
-
 if __name__ == "__main__":
     inspect_product_and_receptions("CEMII")
@@ -1,6 +1,6 @@
 import inspect
-from logic import BusinessLogic
-logic = BusinessLogic()
+from logic import get_logic
+logic = get_logic()
 try:
     print(inspect.getsource(logic.perform_annual_closure))
 except Exception as e:
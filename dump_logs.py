@@ -1,20 +1,21 @@
-import sqlite3
-import pandas as pd
-from database import DatabaseManager
+from db_utils import get_conn
 
-db = DatabaseManager()
-conn = db._get_connection()
+conn = get_conn(read_only=True)
+
+def print_rows(sql):
+    cursor = conn.execute(sql)
+    print('\t'.join(d[0] for d in cursor.description))
+    for row in cursor:
+        print('\t'.join(map(str, row)))
 
 print("=== AUDIT LOGS (Last 20) ===")
 try:
-    df_audit = pd.read_sql_query("SELECT * FROM audit_logs ORDER BY timestamp DESC LIMIT 20", conn)
-    print(df_audit.to_string())
+    print_rows("SELECT * FROM audit_logs ORDER BY timestamp DESC LIMIT 20")
 except Exception as e:
     print(f"Error reading audit_logs: {e}")
 
 print("\n=== STOCK MOVEMENTS (Last 20) ===")
 try:
-    df_move = pd.read_sql_query("SELECT * FROM stock_movements ORDER BY created_at DESC LIMIT 20", conn)
-    print(df_move.to_string())
+    print_rows("SELECT * FROM stock_movements ORDER BY created_at DESC LIMIT 20")
 except Exception as e:
     print(f"Error reading stock_movements: {e}")
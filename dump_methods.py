@@ -1,7 +1,7 @@
 import inspect
-from logic import BusinessLogic
+from logic import get_logic
 
-logic = BusinessLogic()
+logic = get_logic()
 
 print("Source of calculate_client_balance:")
 try:
@@ -1,24 +1,18 @@
 
-import sqlite3
+from db_utils import get_conn
 
 def dump_mv():
-    conn = sqlite3.connect(r"C:\GICA_PROJET\gestion_commerciale.db")
-    conn.row_factory = sqlite3.Row
+    conn = get_conn(read_only=True)
     c = conn.cursor()
     
     # Target Product 40
     print("--- RAW MOVEMENTS PRODUCT 40 ---")
-    c.execute("SELECT * FROM stock_movements WHERE product_id=40")
-    rows = c.fetchall()
+    c.execute("SELECT id, type_mouvement, quantite, reference_document FROM stock_movements WHERE product_id=40")
+    for mv_id, type_mv, qty, ref in c:
+        print(f"ID={mv_id} | Type={type_mv} | Qty={qty} | Ref={ref}")
     
-    total = 0
-    for r in rows:
-        print(f"ID={r['id']} | Type={r['type_mouvement']} | Qty={r['quantite']} | Ref={r['reference_document']}")
-        total += r['quantite']
-        
+    (total,) = c.execute("SELECT COALESCE(SUM(quantite), 0) FROM stock_movements WHERE product_id=40").fetchone()
     print(f"TOTAL SUM: {total}")
-    
-    conn.close()
 
 if __name__ == "__main__":
     dump_mv()
@@ -1,24 +1,29 @@
-from database import DatabaseManager
+from db_utils import get_conn, get_db_path
 from datetime import datetime
 import json
 import traceback
 
 def fix_chronology():
-    # Use DatabaseManager to ensure correct DB path
-    db = DatabaseManager()
-    conn = db._get_connection()
-    # conn.row_factory = sqlite3.Row # DatabaseManager might not set this or returns custom objects?
-    # DatabaseManager usually sets row_factory to sqlite3.Row in _get_connection/init
-    # Let's verify or set it.
-    import sqlite3
-    conn.row_factory = sqlite3.Row
+    # Shared script connection (same DB path resolution as the application, row_factory = sqlite3.Row)
+    conn = get_conn()
     cursor = conn.cursor()
     
-    print(f"Connected to DB: {db.db_path}")
+    print(f"Connected to DB: {get_db_path()}")
     print("Starting Chronological Stock Repair...")
     
+    # One-shot bulk rebuild: rollback journal in RAM, no fsync, big page cache.
+    # Nothing is committed before the end, so a failure leaves the DB untouched.
+    saved_pragmas = {
+        name: conn.execute(f"PRAGMA {name}").fetchone()[0]
+        for name in ("journal_mode", "synchronous", "cache_size")
+    }
+    conn.execute("PRAGMA journal_mode=MEMORY")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-262144")  # 256 MB
+    
     try:
-        conn.execute("BEGIN TRANSACTION")
+        conn.execute("BEGIN IMMEDIATE")
         
         # 1. Snapshot Manual Adjustments (if any)
         # We need to preserve movements that are NOT Receptions or Factures
@@ -32,113 +37,101 @@ def fix_chronology():
         print("Resetting product stocks...")
         cursor.execute("UPDATE products SET stock_actuel = COALESCE(stock_initial, 0)")
         
-        # 4. Fetch All Valid Actions
-        actions = []
-        
-        # 4a. Receptions
-        print("Fetching Receptions...")
-        cursor.execute("SELECT * FROM receptions WHERE lieu_livraison = 'Sur Stock'")
-        receptions = cursor.fetchall()
-        for r in receptions:
-            date_mv = r['date_reception']
-            # Fallback if date is missing
-            if not date_mv: date_mv = r['created_at'][:10]
-            
-            actions.append({
-                'date': date_mv,
-                'created_at': r['created_at'],
-                'type': 'Réception',
-                'product_id': r['product_id'],
-                'quantite': r['quantite_recue'],
-                'ref': f"BL {r['numero']}",
-                'doc_id': r['id'],
-                'user': r['created_by']
-            })
-            
-        # 4b. Factures (Sales) - EXCLUDING Cancelled
-        print("Fetching Sales...")
-        cursor.execute("SELECT * FROM factures WHERE statut != 'ANNULEE'")
-        factures = cursor.fetchall()
-        
-        for f in factures:
-            date_mv = f['date_facture']
-            if not date_mv: date_mv = f['created_at'][:10]
-            
-            # Fetch lines
-            cursor.execute("SELECT * FROM lignes_facture WHERE facture_id = ?", (f['id'],))
-            lignes = cursor.fetchall()
-            
-            for l in lignes:
-                qty = l['quantite']
-                mvm_type = 'Vente'
-                sign = -1
+        # 4. All Valid Actions, pre-joined:
+        #    4a. Receptions 'Sur Stock'
+        #    4b. Factures (Sales) lines - EXCLUDING Cancelled (Avoir = stock return)
+        # Date falls back to created_at[:10] if missing.
+        # Parent/Child logic: a child's movement goes to its parent (ref "(Via <child>)").
+        #
+        # 5. Replay Order
+        # Primary: Date, Secondary: Created_At (to keep order within same day),
+        # then fetch order (receptions before invoice lines, by id).
+        #
+        # 6. Replay Actions (running stock per target product)
+        # A seed row carrying COALESCE(stock_initial, 0) opens each target's ledger;
+        # the running SUM() window then gives stock_apres, and LAG() the stock_avant.
+        print("Replaying actions...")
+        cursor.execute("""
+            WITH actions AS (
+                SELECT COALESCE(NULLIF(date_reception, ''), substr(created_at, 1, 10)) AS date_mv,
+                       created_at, 0 AS src, id AS line_id,
+                       'Réception' AS type_mouvement, product_id, quantite_recue AS quantite,
+                       'BL ' || numero AS ref, id AS doc_id, created_by
+                FROM receptions
+                WHERE lieu_livraison = 'Sur Stock'
                 
-                if f['type_document'] == 'Avoir':
-                    mvm_type = 'Retour Avoir'
-                    sign = 1
+                UNION ALL
                 
-                actions.append({
-                    'date': date_mv,
-                    'created_at': f['created_at'],
-                    'type': mvm_type,
-                    'product_id': l['product_id'],
-                    'quantite': qty * sign,
-                    'ref': f"Fact {f['numero']}",
-                    'doc_id': f['id'],
-                    'user': f['created_by']
-                })
-
-        # 5. Sort Actions
-        # Primary: Date, Secondary: Created_At (to keep order within same day)
-        print(f"Sorting {len(actions)} actions...")
-        actions.sort(key=lambda x: (x['date'], x['created_at']))
+                SELECT COALESCE(NULLIF(f.date_facture, ''), substr(f.created_at, 1, 10)),
+                       f.created_at, 1, l.id,
+                       CASE WHEN f.type_document = 'Avoir' THEN 'Retour Avoir' ELSE 'Vente' END,
+                       l.product_id,
+                       CASE WHEN f.type_document = 'Avoir' THEN l.quantite ELSE -l.quantite END,
+                       'Fact ' || f.numero, f.id, f.created_by
+                FROM factures f
+                JOIN lignes_facture l ON l.facture_id = f.id
+                WHERE f.statut != 'ANNULEE'
+            ),
+            targeted AS (
+                SELECT a.*,
+                       CASE WHEN p.parent_stock_id THEN p.parent_stock_id ELSE a.product_id END AS target_pid,
+                       CASE WHEN p.parent_stock_id
+                            THEN ' (Via ' || COALESCE(NULLIF(p.code_produit, ''), p.nom) || ')'
+                            ELSE '' END AS ref_addon
+                FROM actions a
+                LEFT JOIN products p ON p.id = a.product_id
+            ),
+            ledger AS (
+                SELECT 1 AS is_action, date_mv, created_at, src, line_id, type_mouvement,
+                       quantite, ref || ref_addon AS ref, doc_id, created_by, target_pid
+                FROM targeted
+                
+                UNION ALL
+                
+                SELECT 0, NULL, NULL, NULL, NULL, NULL,
+                       COALESCE(stock_initial, 0), NULL, NULL, NULL, id
+                FROM products
+                WHERE id IN (SELECT target_pid FROM targeted)
+            ),
+            running AS (
+                SELECT *,
+                       SUM(quantite) OVER (
+                           PARTITION BY target_pid
+                           ORDER BY is_action, date_mv, created_at, src, doc_id, line_id
+                           ROWS UNBOUNDED PRECEDING
+                       ) AS stock_apres
+                FROM ledger
+            ),
+            replay AS (
+                SELECT *,
+                       COALESCE(LAG(stock_apres) OVER (
+                           PARTITION BY target_pid
+                           ORDER BY is_action, date_mv, created_at, src, doc_id, line_id
+                       ), 0.0) AS stock_avant
+                FROM running
+            )
+            INSERT INTO stock_movements
+            (product_id, type_mouvement, quantite, reference_document, 
+             document_id, stock_avant, stock_apres, created_by, date_mouvement, created_at)
+            SELECT target_pid, type_mouvement, quantite, ref,
+                   doc_id, stock_avant, stock_apres, created_by, date_mv,
+                   created_at -- Preserve original timestamp for audit
+            FROM replay
+            WHERE is_action = 1
+            ORDER BY date_mv, created_at, src, doc_id, line_id
+        """)
+        count = cursor.execute("SELECT COUNT(*) FROM stock_movements").fetchone()[0]
         
-        # 6. Replay Actions
-        print("Replaying actions...")
-        count = 0
-        for action in actions:
-            pid = action['product_id']
-            
-            # Resolve Parent/Child logic
-            # Use database logic: if child, move to parent
-            cursor.execute("SELECT parent_stock_id, code_produit, nom FROM products WHERE id = ?", (pid,))
-            res = cursor.fetchone()
-            target_pid = pid
-            ref_addon = ""
-            
-            if res and res['parent_stock_id']:
-                target_pid = res['parent_stock_id']
-                child_info = res['code_produit'] or res['nom']
-                ref_addon = f" (Via {child_info})"
-            
-            # Get Current Stock (of target)
-            cursor.execute("SELECT stock_actuel FROM products WHERE id = ?", (target_pid,))
-            cur_stock = cursor.fetchone()[0] or 0.0
-            
-            new_stock = cur_stock + action['quantite']
-            
-            # Insert Movement
-            cursor.execute("""
-                INSERT INTO stock_movements
-                (product_id, type_mouvement, quantite, reference_document, 
-                 document_id, stock_avant, stock_apres, created_by, date_mouvement, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                target_pid, 
-                action['type'], 
-                action['quantite'], 
-                action['ref'] + ref_addon,
-                action['doc_id'],
-                cur_stock, 
-                new_stock, 
-                action['user'], 
-                action['date'],
-                action['created_at'] # Preserve original timestamp for audit
-            ))
-            
-            # Update Product
-            cursor.execute("UPDATE products SET stock_actuel = ? WHERE id = ?", (new_stock, target_pid))
-            count += 1
+        # Update Products (final stock = last movement of each target)
+        cursor.execute("""
+            UPDATE products
+            SET stock_actuel = (
+                SELECT sm.stock_apres FROM stock_movements sm
+                WHERE sm.product_id = products.id
+                ORDER BY sm.id DESC LIMIT 1
+            )
+            WHERE id IN (SELECT product_id FROM stock_movements)
+        """)
             
         conn.commit()
         print(f"Success! Replayed {count} movements.")
@@ -147,6 +140,9 @@ def fix_chronology():
         conn.rollback()
         print(f"FAILED: {e}")
         traceback.print_exc()
+    finally:
+        for name, value in saved_pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
 
 if __name__ == "__main__":
     fix_chronology()
@@ -1,9 +1,9 @@
 
-from logic import BusinessLogic
+from logic import get_logic
 
 def fix_stocks():
     print("Running Global Stock Recalculation...")
-    logic = BusinessLogic()
+    logic = get_logic()
     stats = logic.recalculate_global_stock()
     print("Recalculation Complete.")
     print(f"Stats: {stats}")
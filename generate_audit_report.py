@@ -1,13 +1,20 @@
-import sqlite3
-import pandas as pd
-from database import DatabaseManager
+import sys
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+from db_utils import get_conn, explain
 
 def generate_report():
-    db = DatabaseManager()
-    conn = db._get_connection()
+    conn = get_conn(read_only=True)
+    
+    # Audited products resolved first: LIKE '%...%' cannot use an index,
+    # so it is only run on products and the movements are filtered by id
+    product_ids = [row[0] for row in conn.execute(
+        "SELECT id FROM products WHERE nom LIKE '%CEM I/42.5%' OR nom LIKE '%CEMII A-L 42.5%'"
+    )]
+    placeholders = ",".join("?" * len(product_ids)) or "NULL"
     
     # query to get stock movements with related info
-    query = """
+    query = f"""
         SELECT 
             s.created_at as "Date et Heure Serveur",
             s.type_mouvement as "Type de Mouvement",
@@ -20,14 +27,17 @@ def generate_report():
         FROM stock_movements s
         JOIN products p ON s.product_id = p.id
         LEFT JOIN users u ON s.created_by = u.id
-        WHERE (p.nom LIKE '%CEM I/42.5%' OR p.nom LIKE '%CEMII A-L 42.5%')
+        WHERE s.product_id IN ({placeholders})
           AND s.created_at >= '2026-01-01 00:00:00' 
           AND s.created_at <= '2026-01-14 23:59:59'
         ORDER BY s.created_at ASC
     """
     
     try:
-        df = pd.read_sql_query(query, conn)
+        if "--explain" in sys.argv:
+            explain(conn, query, product_ids)
+        cursor = conn.execute(query, product_ids)
+        headers = [d[0] for d in cursor.description]
         
         # Add calculated flux column for clarity if needed, but 'Mouvement' is already signed (usually? check logic)
         # Logic: stock_apres = stock_avant + quantite. So quantite is the signed flux.
@@ -45,17 +55,22 @@ def generate_report():
         
         output_file = "Rapport_Audit_Stock_CEM.xlsx"
         
-        # Formatting for Excel
-        writer = pd.ExcelWriter(output_file, engine='openpyxl') 
-        df.to_excel(writer, index=False, sheet_name='Audit Flux')
+        # Column widths: computed by SQLite (write-only sheets need them before the first row)
+        width_sql = ", ".join(f'MAX(LENGTH("{h}"))' for h in headers)
+        max_lens = conn.execute(f"SELECT {width_sql} FROM ({query})", product_ids).fetchone()
+        
+        # Formatting for Excel (streamed, rows are never held in memory)
+        wb = Workbook(write_only=True)
+        worksheet = wb.create_sheet('Audit Flux')
+        for idx, col in enumerate(headers, start=1):
+            max_len = max(max_lens[idx - 1] or 0, len(col)) + 2
+            worksheet.column_dimensions[get_column_letter(idx)].width = max_len
         
-        # Adjust column widths
-        worksheet = writer.sheets['Audit Flux']
-        for idx, col in enumerate(df.columns):
-            max_len = max(df[col].astype(str).map(len).max(), len(col)) + 2
-            worksheet.column_dimensions[chr(65 + idx)].width = max_len
+        worksheet.append(headers)
+        for row in cursor:
+            worksheet.append(list(row))
             
-        writer.close()
+        wb.save(output_file)
         print(f"Rapport généré avec succès : {output_file}")
         
     except Exception as e:
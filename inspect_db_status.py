@@ -1,16 +1,13 @@
 
-import sqlite3
 import os
-
-db_path = "gestion_commerciale.db"
+from db_utils import get_conn, get_db_path
 
 def inspect():
-    if not os.path.exists(db_path):
+    if not os.path.exists(get_db_path()):
         print("DB not found")
         return
 
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+    conn = get_conn(read_only=True)
     c = conn.cursor()
 
     print("--- INVOICES ---")
@@ -24,7 +21,5 @@ def inspect():
     for r in rows:
         pass # just checking join
 
-    conn.close()
-
 if __name__ == "__main__":
     inspect()
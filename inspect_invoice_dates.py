@@ -1,16 +1,15 @@
 
 import sqlite3
 import os
-
-DB_PATH = r"C:\GICA_PROJET\gestion_commerciale.db"
+from db_utils import get_conn, get_db_path
 
 def inspect_dates():
-    if not os.path.exists(DB_PATH):
-        print(f"Error: Database not found at {DB_PATH}")
+    if not os.path.exists(get_db_path()):
+        print(f"Error: Database not found at {get_db_path()}")
         return
 
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_conn(read_only=True)
         cursor = conn.cursor()
 
         print("--- All unique date formats found in factures ---")
@@ -27,9 +26,6 @@ def inspect_dates():
 
     except sqlite3.Error as e:
         print(f"Database error: {e}")
-    finally:
-        if conn:
-            conn.close()
 
 if __name__ == "__main__":
     inspect_dates()
@@ -1,14 +1,9 @@
-import sqlite3
-from database import DatabaseManager
+from db_utils import get_conn
 
-def inspect_jan_11():
-    db = DatabaseManager()
-    conn = db._get_connection()
+def inspect_jan_11(start_date='2026-01-11'):
+    conn = get_conn(read_only=True)
     cursor = conn.cursor()
     
-    start_date = '2026-01-11'
-    end_date = '2026-01-11'
-    
     print(f"--- Receptions ({start_date}) ---")
     cursor.execute("""
         SELECT r.id, r.date_reception, r.numero, r.lieu_livraison, r.quantite_recue, r.product_id, p.nom as product
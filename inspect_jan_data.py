@@ -1,15 +1,9 @@
-import sqlite3
-import pandas as pd
-from database import DatabaseManager
+from db_utils import get_conn
 
-def inspect_data():
-    db = DatabaseManager()
-    conn = db._get_connection()
+def inspect_data(start_date='2026-01-10', end_date='2026-01-14'):
+    conn = get_conn(read_only=True)
     cursor = conn.cursor()
     
-    start_date = '2026-01-10'
-    end_date = '2026-01-14'
-    
     print(f"--- Receptions ({start_date} to {end_date}) ---")
     cursor.execute("""
         SELECT r.id, r.date_reception, r.numero, r.lieu_livraison, r.quantite_recue, p.nom as product
@@ -1,14 +1,9 @@
-import sqlite3
-from database import DatabaseManager
+from db_utils import get_conn
 
-def inspect_receptions():
-    db = DatabaseManager()
-    conn = db._get_connection()
+def inspect_receptions(start_date='2026-01-12', end_date='2026-01-12'):
+    conn = get_conn(read_only=True)
     cursor = conn.cursor()
     
-    start_date = '2026-01-12'
-    end_date = '2026-01-12'
-    
     print(f"--- Receptions ({start_date} to {end_date}) for CEMII ---")
     cursor.execute("""
         SELECT r.id, r.date_reception, r.numero, r.lieu_livraison, r.quantite_recue, p.nom as product
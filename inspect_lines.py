@@ -1,9 +1,8 @@
 
-import sqlite3
+from db_utils import get_conn
 
 def check_lines():
-    conn = sqlite3.connect("gestion_commerciale.db")
-    conn.row_factory = sqlite3.Row
+    conn = get_conn(read_only=True)
     c = conn.cursor()
     
     print("--- INVOICE LINES DETAIL ---")
@@ -1,10 +1,7 @@
-import sqlite3
-
-DB_PATH = "gestion_commerciale.db"
+from db_utils import get_conn
 
 def check_receptions():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = get_conn(read_only=True)
     cursor = conn.cursor()
     
     print("Inspecting Receptions for 'None' or NULL entries...")
@@ -26,7 +23,5 @@ def check_receptions():
         for row in cursor.fetchall():
             print(dict(row))
 
-    conn.close()
-
 if __name__ == "__main__":
     check_receptions()
@@ -1,10 +1,13 @@
 
-import sqlite3
+from db_utils import get_conn
 
-conn = sqlite3.connect('gestion.db')
-cursor = conn.cursor()
-cursor.execute("PRAGMA table_info(factures)")
-columns = cursor.fetchall()
-for col in columns:
-    print(col)
-conn.close()
+def show_schema(table='factures'):
+    conn = get_conn(read_only=True)
+    cursor = conn.cursor()
+    cursor.execute(f'PRAGMA table_info("{table}")')
+    columns = cursor.fetchall()
+    for col in columns:
+        print(tuple(col))
+
+if __name__ == "__main__":
+    show_schema()
@@ -1,10 +1,8 @@
 
-import sqlite3
-from database import DatabaseManager
+from db_utils import get_conn
 
 def inspect_movements():
-    db = DatabaseManager()
-    conn = db._get_connection()
+    conn = get_conn(read_only=True)
     c = conn.cursor()
     
     print("--- Stock Movements ---")
@@ -0,0 +1,100 @@
+"""
+All inspect_* scripts behind one command, sharing one process and one connection.
+
+Usage:
+    python inspect_tool.py products
+    python inspect_tool.py jan-data --from 2026-01-10 --to 2026-01-14
+    python inspect_tool.py repl          (keeps the connection open, one command per line)
+"""
+
+import argparse
+import shlex
+
+import inspect_db_status
+import inspect_invoice_dates
+import inspect_jan_11
+import inspect_jan_data
+import inspect_jan_data_v2
+import inspect_lines
+import inspect_products
+import inspect_reception_dates
+import inspect_receptions
+import inspect_schema
+import inspect_stock
+import inspect_transport
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="inspect_tool", description="Inspection de la base GICA")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("status", help="Factures (inspect_db_status)").set_defaults(
+        run=lambda a: inspect_db_status.inspect())
+    sub.add_parser("invoice-dates", help="Formats de date des factures").set_defaults(
+        run=lambda a: inspect_invoice_dates.inspect_dates())
+    sub.add_parser("reception-dates", help="Dates des réceptions (échantillon)").set_defaults(
+        run=lambda a: inspect_reception_dates.inspect_dates())
+    sub.add_parser("lines", help="Lignes de factures (échantillon)").set_defaults(
+        run=lambda a: inspect_lines.check_lines())
+    sub.add_parser("products", help="Liste des produits").set_defaults(
+        run=lambda a: inspect_products.list_products())
+    sub.add_parser("receptions", help="Réceptions sans numéro").set_defaults(
+        run=lambda a: inspect_receptions.check_receptions())
+    sub.add_parser("stock", help="Mouvements de stock").set_defaults(
+        run=lambda a: inspect_stock.inspect_movements())
+    sub.add_parser("transport", help="Répartition par transporteur").set_defaults(
+        run=lambda a: inspect_transport.check_data())
+
+    p = sub.add_parser("schema", help="Colonnes d'une table")
+    p.add_argument("--table", default="factures")
+    p.set_defaults(run=lambda a: inspect_schema.show_schema(a.table))
+
+    p = sub.add_parser("day", help="Réceptions et ventes d'une journée")
+    p.add_argument("--date", default="2026-01-11")
+    p.set_defaults(run=lambda a: inspect_jan_11.inspect_jan_11(a.date))
+
+    p = sub.add_parser("jan-data", help="Réceptions et ventes sur une période")
+    p.add_argument("--from", dest="start", default="2026-01-10")
+    p.add_argument("--to", dest="end", default="2026-01-14")
+    p.set_defaults(run=lambda a: inspect_jan_data.inspect_data(a.start, a.end))
+
+    p = sub.add_parser("reception-range", help="Réceptions sur une période")
+    p.add_argument("--from", dest="start", default="2026-01-12")
+    p.add_argument("--to", dest="end", default="2026-01-12")
+    p.set_defaults(run=lambda a: inspect_jan_data_v2.inspect_receptions(a.start, a.end))
+
+    sub.add_parser("repl", help="Mode interactif (connexion gardée ouverte)").set_defaults(run=None)
+    return parser
+
+
+def repl(parser: argparse.ArgumentParser):
+    print(parser.format_usage().strip() + "  (quit pour sortir)")
+    while True:
+        try:
+            line = input("inspect> ").strip()
+        except EOFError:
+            break
+        if line in ("quit", "exit"):
+            break
+        if not line:
+            continue
+        try:
+            args = parser.parse_args(shlex.split(line))
+        except SystemExit:
+            continue  # argparse already printed the error / help
+        if args.run is None:
+            continue
+        args.run(args)
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.run is None:
+        repl(parser)
+    else:
+        args.run(args)
+
+
+if __name__ == "__main__":
+    main()
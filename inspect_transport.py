@@ -1,16 +1,14 @@
 
-import sqlite3
 import os
-
-DB_PATH = os.path.join("c:\\GICA_PROJET", "gestion_commerciale.db")
+from db_utils import get_conn, get_db_path
 
 def check_data():
-    if not os.path.exists(DB_PATH):
+    if not os.path.exists(get_db_path()):
         print("Database not found!")
         return
 
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_conn(read_only=True)
         cursor = conn.cursor()
         
         # Check raw data
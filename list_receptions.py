@@ -1,10 +1,7 @@
-import sqlite3
-
-DB_PATH = "gestion_commerciale.db"
+from db_utils import get_conn
 
 def list_receptions():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = get_conn(read_only=True)
     cursor = conn.cursor()
     
     print("Listing ALL Receptions:")
@@ -15,7 +12,6 @@ def list_receptions():
         print(dict(row))
         
     print(f"Total rows: {len(rows)}")
-    conn.close()
 
 if __name__ == "__main__":
     list_receptions()
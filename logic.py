@@ -4,7 +4,7 @@ Handles financial calculations, stock management, and business rules
 """
 
 from typing import Dict, Any, Optional, List, Tuple
-from datetime import datetime
+from datetime import datetime, timedelta
 from database import get_db
 
 try:
@@ -42,10 +42,11 @@ class BusinessLogic:
     
     # ==================== STOCK MANAGEMENT ====================
     
-    def process_reception(self, reception_id: int, user_id: int) -> bool:
+    def process_reception(self, reception_id: int, user_id: int, commit: bool = True) -> bool:
         """
         Process reception and update stock if 'Sur Stock'
         Returns True if successful
+        commit=False leaves the transaction open for the caller
         """
         conn = self.db._get_connection()
         cursor = conn.cursor()
@@ -78,7 +79,8 @@ class BusinessLogic:
                 reference_document=numero,
                 document_id=reception_id,
                 created_by=user_id,
-                date_mouvement=date_reception
+                date_mouvement=date_reception,
+                commit=commit
             )
             
             # Update actual stock quantity is already handled by log_stock_movement
@@ -86,10 +88,11 @@ class BusinessLogic:
         
         return True
     
-    def revert_reception_stock_impact(self, reception_id: int) -> bool:
+    def revert_reception_stock_impact(self, reception_id: int, commit: bool = True) -> bool:
         """
         Revert stock impact for a reception (undo +Qty).
         Used before updating a reception to ensure clean state.
+        commit=False leaves the transaction open for the caller
         """
         conn = self.db._get_connection()
         cursor = conn.cursor()
@@ -111,10 +114,12 @@ class BusinessLogic:
                 # Delete the specific 'Réception' movement
                 cursor.execute("DELETE FROM stock_movements WHERE document_id = ? AND type_mouvement = 'Réception'", (reception_id,))
                 
-                conn.commit()
+                if commit:
+                    conn.commit()
                 return True
             except Exception as e:
-                conn.rollback()
+                if commit:
+                    conn.rollback()
                 return False
                 
         return True
@@ -148,11 +153,12 @@ class BusinessLogic:
                 # to align with the removal of the history.
                 cursor.execute("UPDATE products SET stock_actuel = stock_actuel - ? WHERE id = ?", (quantite, product_id))
             
-                # 2. Delete all stock movements related to this reception
-                cursor.execute("DELETE FROM stock_movements WHERE document_id = ? AND type_mouvement = 'Réception'", (reception_id,))
-                
-                # Also delete any 'Annulation' artifacts if they exist (cleanup from previous bugs)
-                cursor.execute("DELETE FROM stock_movements WHERE document_id = ? AND type_mouvement = 'Annulation Réception'", (reception_id,))
+                # 2. Delete all stock movements related to this reception,
+                # including any 'Annulation' artifacts (cleanup from previous bugs)
+                cursor.execute("""
+                    DELETE FROM stock_movements
+                    WHERE document_id = ? AND type_mouvement IN ('Réception', 'Annulation Réception')
+                """, (reception_id,))
             
             # 3. Delete reception
             cursor.execute("DELETE FROM receptions WHERE id = ?", (reception_id,))
@@ -195,25 +201,25 @@ class BusinessLogic:
             # We log this as "Annulation Facture" to be traced.
             
             details_stock = []
+            movements = []
+            
+            # Existing products of the lines, one query
+            products = self.db.get_stocks_for_products([l['product_id'] for l in facture['lignes']])
             
             for ligne in facture['lignes']:
                 pid = ligne['product_id']
                 qty = ligne['quantite'] # This is positive in DB for lines
                 
                 # Check if product exists
-                product = self.db.get_product_by_id(pid)
+                product = products.get(pid)
                 if product:
-                     # Log Movement
-                     self.db.log_stock_movement(
-                        product_id=pid,
-                        type_mouvement='Annulation Facture',
-                        quantite=qty, # Positive to add back to stock
-                        reference_document=f"Annul {facture['numero']}",
-                        document_id=facture_id, # Link to same ID? Or new? Standard is link to Doc.
-                        created_by=user_id,
-                        date_mouvement=facture['date_facture']
-                     )
+                     # Movement: positive to add back to stock, linked to the same document
+                     movements.append((pid, 'Annulation Facture', qty, f"Annul {facture['numero']}",
+                                       facture_id, user_id, facture['date_facture']))
                      details_stock.append(f"{product['nom']}: +{qty}")
+            
+            # All lines in one batch, committed with the rest of the cancellation
+            self.db.log_stock_movements_bulk(movements, commit=False)
 
             # 3. Log to Journal_Annulations
             import json
@@ -260,33 +266,35 @@ class BusinessLogic:
         """
         Process invoice stock impact (decrease for facture, increase for avoir)
         """
-        facture = self.db.get_facture_by_id(facture_id)
-        if not facture:
+        # Only the header fields and the lines' product/quantity are needed (no full facture dict)
+        conn = self.db._get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT f.type_document, f.numero, f.date_facture, l.product_id, l.quantite
+            FROM factures f
+            LEFT JOIN lignes_facture l ON l.facture_id = f.id
+            WHERE f.id = ?
+            ORDER BY l.id
+        """, (facture_id,))
+        rows = cursor.fetchall()
+        if not rows:
             return False
         
-        type_document = facture['type_document']
-        numero = facture['numero']
+        type_document, numero, date_facture = rows[0][:3]
         
-        # Process each line item
-        for ligne in facture['lignes']:
-            # For invoices, decrease stock (negative quantity)
-            # For credit notes, increase stock (positive quantity)
-            if type_document == 'Facture':
-                quantite = -ligne['quantite']
-                mouvement = 'Vente'
-            else:  # Avoir
-                quantite = ligne['quantite']
-                mouvement = 'Retour Avoir'
-
-            self.db.log_stock_movement(
-                product_id=ligne['product_id'],
-                type_mouvement=mouvement,
-                quantite=quantite,
-                reference_document=numero,
-                document_id=facture_id,
-                created_by=user_id,
-                date_mouvement=facture['date_facture']
-            )
+        # For invoices, decrease stock (negative quantity)
+        # For credit notes, increase stock (positive quantity)
+        if type_document == 'Facture':
+            sign, mouvement = -1, 'Vente'
+        else:  # Avoir
+            sign, mouvement = 1, 'Retour Avoir'
+        
+        # All line items in one batch (single commit)
+        self.db.log_stock_movements_bulk([
+            (row['product_id'], mouvement, sign * row['quantite'], numero,
+             facture_id, user_id, date_facture)
+            for row in rows if row['product_id'] is not None
+        ])
         
         return True
     
@@ -296,9 +304,9 @@ class BusinessLogic:
         """
         conn = self.db._get_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM products WHERE parent_stock_id = ? AND id != ?", (product_id, product_id))
-        count = cursor.fetchone()[0]
-        return count > 0
+        # Stops at the first child (idx_products_parent) instead of counting them all
+        cursor.execute("SELECT 1 FROM products WHERE parent_stock_id = ? AND id != ? LIMIT 1", (product_id, product_id))
+        return cursor.fetchone() is not None
 
     def get_current_stock(self, product_id: int) -> float:
         """Get current stock for a product"""
@@ -311,23 +319,13 @@ class BusinessLogic:
         If product has a parent, check parent's stock.
         Returns (is_available, current_stock)
         """
-        product = self.db.get_product_by_id(product_id)
+        # Product and parent in one lookup: stock_actuel is the parent's, or the product's own
+        # if it has no parent (or the parent linking is broken)
+        product = self.db.get_stocks_for_products([product_id]).get(product_id)
         if not product:
             return (False, 0.0)
-            
-        target_id = product.get('parent_stock_id') or product_id
         
-        # If target is different, fetch parent
-        if target_id != product_id:
-            parent = self.db.get_product_by_id(target_id)
-            if parent:
-                current_stock = parent['stock_actuel']
-            else:
-                # Fallback to own stock if parent linking is broken
-                current_stock = product['stock_actuel']
-        else:
-            current_stock = product['stock_actuel']
-            
+        current_stock = product['stock_actuel']
         return (current_stock >= quantite, current_stock)
 
     def recalculate_global_stock(self) -> Dict[str, int]:
@@ -345,71 +343,37 @@ class BusinessLogic:
         try:
             conn.execute("BEGIN TRANSACTION")
             
-            # 1. Reset Stock to Initial
-            cursor.execute("UPDATE products SET stock_actuel = stock_initial")
+            # 1. Reset Stock to Initial: done by step 3, which rewrites every product
             
-            # 2. Fix Missing Reception Movements
-            cursor.execute("SELECT id, product_id, quantite_recue, numero, created_by FROM receptions WHERE lieu_livraison = 'Sur Stock'")
-            receptions = cursor.fetchall()
-            
-            for r in receptions:
-                # Check if movement exists
-                cursor.execute("""
-                    SELECT id FROM stock_movements 
-                    WHERE document_id = ? AND type_mouvement = 'Réception' 
-                    AND product_id = ?
-                """, (r['id'], r['product_id']))
-                mv = cursor.fetchone()
-                
-                if not mv:
-                    # Create missing movement
-                    # Note: We don't update stock_actuel here, we do it in bulk later or let the loop handle it
-                    # actually log_stock_movement updates stock_actuel.
-                    # But since we reset to initial, we can just replay all movements.
-                    
-                    # Wait, log_stock_movement adds to current stock.
-                    # If we just reset to initial, we should iterate ALL movements (existing + new) and apply.
-                    # OR we can just use SQL to sum them up.
-                    
-                    # Let's insert the missing movement first.
-                    stock_avant = 0 # Placeholder, we will recalc numbers anyway
-                    stock_apres = 0 
-                    
-                    # Correctly attribute to Parent if Child
-                    target_pid = r['product_id']
-                    
-                    # Check if product is child
-                    cursor.execute("SELECT parent_stock_id FROM products WHERE id=?", (target_pid,))
-                    res = cursor.fetchone()
-                    if res and res[0]:
-                        target_pid = res[0]
-                    
-                    cursor.execute("""
-                        INSERT INTO stock_movements 
-                        (product_id, type_mouvement, quantite, reference_document,
-                         document_id, stock_avant, stock_apres, created_by)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (target_pid, 'Réception', r['quantite_recue'], r['numero'],
-                          r['id'], stock_avant, stock_apres, r['created_by']))
-                    stats["receptions_fixed"] += 1
+            # 2. Fix Missing Reception Movements (one INSERT ... SELECT)
+            # Movement is attributed to the Parent if the product is a Child.
+            # stock_avant/stock_apres are placeholders: stock is recomputed below from the sums.
+            cursor.execute("""
+                INSERT INTO stock_movements 
+                (product_id, type_mouvement, quantite, reference_document,
+                 document_id, stock_avant, stock_apres, created_by)
+                SELECT CASE WHEN p.parent_stock_id THEN p.parent_stock_id ELSE r.product_id END,
+                       'Réception', r.quantite_recue, r.numero, r.id, 0, 0, r.created_by
+                FROM receptions r
+                LEFT JOIN products p ON p.id = r.product_id
+                WHERE r.lieu_livraison = 'Sur Stock'
+                  AND NOT EXISTS (
+                      SELECT 1 FROM stock_movements sm
+                      WHERE sm.document_id = r.id AND sm.type_mouvement = 'Réception'
+                        AND sm.product_id = r.product_id
+                  )
+                ORDER BY r.id
+            """)
+            stats["receptions_fixed"] = cursor.rowcount
             
             # 3. Recalculate Stock for ALL Products from Movements
-            # Stock = Initial + Sum(Movements)
-            
-            cursor.execute("SELECT id, stock_initial FROM products")
-            products = cursor.fetchall()
-            
-            for p in products:
-                pid = p['id']
-                initial = p['stock_initial'] or 0.0
-                
-                cursor.execute("SELECT SUM(quantite) FROM stock_movements WHERE product_id = ?", (pid,))
-                delta = cursor.fetchone()[0] or 0.0
-                
-                final_stock = initial + delta
-                
-                cursor.execute("UPDATE products SET stock_actuel = ? WHERE id = ?", (final_stock, pid))
-                stats["products_updated"] += 1
+            # Stock = Initial + Sum(Movements)  (per-product SUM served by idx_mv_product)
+            cursor.execute("""
+                UPDATE products
+                SET stock_actuel = COALESCE(stock_initial, 0.0) + COALESCE(
+                    (SELECT SUM(sm.quantite) FROM stock_movements sm WHERE sm.product_id = products.id), 0.0)
+            """)
+            stats["products_updated"] = cursor.rowcount
             
             conn.commit()
             return stats
@@ -422,8 +386,6 @@ class BusinessLogic:
         """
         Get daily stock valuation logic.
         """
-        import pandas as pd
-        
         conn = self.db._get_connection()
         product = self.db.get_product_by_id(product_id)
         if not product:
@@ -436,72 +398,71 @@ class BusinessLogic:
         # Base
         stock_initial_db = product.get('stock_initial', 0.0)
         
-        # Receptions before start_date
+        # Receptions, Sales (Factures) and Avoirs (Returns, add to stock) before start_date, one round-trip
+        # Sales/Avoirs must join to filter by date AND product
         cursor = conn.cursor()
         cursor.execute("""
-            SELECT COALESCE(SUM(quantite_recue), 0)
-            FROM receptions 
-            WHERE product_id = ? AND date_reception < ? AND lieu_livraison = 'Sur Stock'
-        """, (product_id, start_date))
-        receptions_before = cursor.fetchone()[0]
-        
-        # Sales (Factures) before start_date
-        # Must join to filter by date AND product
-        cursor.execute("""
-            SELECT COALESCE(SUM(lf.quantite), 0)
-            FROM lignes_facture lf
-            JOIN factures f ON lf.facture_id = f.id
-            WHERE lf.product_id = ? AND f.date_facture < ? AND f.type_document = 'Facture' AND f.statut != 'Annulée'
-        """, (product_id, start_date))
-        sales_before = cursor.fetchone()[0]
-        
-        # Avoirs (Returns) before start_date - Adds to stock
-        cursor.execute("""
-            SELECT COALESCE(SUM(lf.quantite), 0)
-            FROM lignes_facture lf
-            JOIN factures f ON lf.facture_id = f.id
-            WHERE lf.product_id = ? AND f.date_facture < ? AND f.type_document = 'Avoir' AND f.statut != 'Annulée'
-        """, (product_id, start_date))
-        avoirs_before = cursor.fetchone()[0]
+            SELECT
+                (SELECT COALESCE(SUM(quantite_recue), 0)
+                 FROM receptions 
+                 WHERE product_id = ? AND date_reception < ? AND lieu_livraison = 'Sur Stock'),
+                (SELECT COALESCE(SUM(lf.quantite), 0)
+                 FROM lignes_facture lf
+                 JOIN factures f ON lf.facture_id = f.id
+                 WHERE lf.product_id = ? AND f.date_facture < ? AND f.type_document = 'Facture' AND f.statut != 'Annulée'),
+                (SELECT COALESCE(SUM(lf.quantite), 0)
+                 FROM lignes_facture lf
+                 JOIN factures f ON lf.facture_id = f.id
+                 WHERE lf.product_id = ? AND f.date_facture < ? AND f.type_document = 'Avoir' AND f.statut != 'Annulée')
+        """, (product_id, start_date) * 3)
+        receptions_before, sales_before, avoirs_before = cursor.fetchone()
         
         calculated_initial = stock_initial_db + receptions_before - sales_before + avoirs_before
         
         # 2. Get Daily Movements in Range
         
-        # Generate date range
-        date_range = pd.date_range(start=start_date, end=end_date)
+        # Generate date range (start_date..end_date included, empty if end < start)
+        first_day = datetime.strptime(start_date, "%Y-%m-%d").date()
+        last_day = datetime.strptime(end_date, "%Y-%m-%d").date()
+        day_strs = [(first_day + timedelta(days=i)).isoformat()
+                    for i in range((last_day - first_day).days + 1)]
         daily_data = []
         
         current_stock = calculated_initial
         
-        for single_date in date_range:
-            day_str = single_date.strftime("%Y-%m-%d")
-            
-            # Receptions for this day
+        # Daily receptions / sales / avoirs of the whole range, one grouped query each
+        rec_by_day, sales_by_day, avoirs_by_day = {}, {}, {}
+        if day_strs:
             cursor.execute("""
-                SELECT COALESCE(SUM(quantite_recue), 0)
+                SELECT date_reception, COALESCE(SUM(quantite_recue), 0)
                 FROM receptions
-                WHERE product_id = ? AND date_reception = ? AND lieu_livraison = 'Sur Stock'
-            """, (product_id, day_str))
-            rec_day = cursor.fetchone()[0]
+                WHERE product_id = ? AND date_reception BETWEEN ? AND ? AND lieu_livraison = 'Sur Stock'
+                GROUP BY date_reception
+            """, (product_id, day_strs[0], day_strs[-1]))
+            rec_by_day = dict(cursor.fetchall())
             
-            # Sales for this day
             cursor.execute("""
-                SELECT COALESCE(SUM(lf.quantite), 0)
+                SELECT f.date_facture, COALESCE(SUM(lf.quantite), 0)
                 FROM lignes_facture lf
                 JOIN factures f ON lf.facture_id = f.id
-                WHERE lf.product_id = ? AND f.date_facture = ? AND f.type_document = 'Facture' AND f.statut != 'Annulée'
-            """, (product_id, day_str))
-            sale_day = cursor.fetchone()[0]
+                WHERE lf.product_id = ? AND f.date_facture BETWEEN ? AND ? AND f.type_document = 'Facture' AND f.statut != 'Annulée'
+                GROUP BY f.date_facture
+            """, (product_id, day_strs[0], day_strs[-1]))
+            sales_by_day = dict(cursor.fetchall())
             
-            # Avoirs for this day
             cursor.execute("""
-                SELECT COALESCE(SUM(lf.quantite), 0)
+                SELECT f.date_facture, COALESCE(SUM(lf.quantite), 0)
                 FROM lignes_facture lf
                 JOIN factures f ON lf.facture_id = f.id
-                WHERE lf.product_id = ? AND f.date_facture = ? AND f.type_document = 'Avoir' AND f.statut != 'Annulée'
-            """, (product_id, day_str))
-            avoir_day = cursor.fetchone()[0]
+                WHERE lf.product_id = ? AND f.date_facture BETWEEN ? AND ? AND f.type_document = 'Avoir' AND f.statut != 'Annulée'
+                GROUP BY f.date_facture
+            """, (product_id, day_strs[0], day_strs[-1]))
+            avoirs_by_day = dict(cursor.fetchall())
+        
+        for day_str in day_strs:
+            rec_day = rec_by_day.get(day_str, 0)
+            sale_day = sales_by_day.get(day_str, 0)
+            avoir_day = avoirs_by_day.get(day_str, 0)
             
             net_sales = sale_day - avoir_day
             
@@ -551,60 +512,30 @@ class BusinessLogic:
         cursor.execute("SELECT id, nom, unite, cout_revient FROM products WHERE active = 1 ORDER BY nom")
         products = cursor.fetchall()
         
+        # Consumption = Sales (Factures), dated by date_facture (stock_movements only has created_at,
+        # which is wrong for backdated documents). Avoirs are not consumption.
+        # Day / month / year quantities of every product in one scan of the year.
+        cursor.execute("""
+            SELECT lf.product_id,
+                   COALESCE(SUM(CASE WHEN f.date_facture >= ? THEN lf.quantite END), 0),
+                   COALESCE(SUM(CASE WHEN f.date_facture >= ? THEN lf.quantite END), 0),
+                   COALESCE(SUM(lf.quantite), 0)
+            FROM lignes_facture lf
+            JOIN factures f ON lf.facture_id = f.id
+            WHERE f.date_facture >= ? AND f.date_facture <= ?
+            AND f.type_document = 'Facture' 
+            AND f.statut != 'Annulée'
+            GROUP BY lf.product_id
+        """, (day_str, month_start, year_start, day_str))
+        qty_by_product = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+        
         report_data = []
         
         for p in products:
             pid = p['id']
             cout = p['cout_revient'] or 0.0
             
-            # Helper to get sum of negative movements (Sales/Consumption)
-            # We assume Consumption = Negative Movements (Vente, Sortie, etc)
-            # We take ABS() to show positive consumption.
-            
-            def get_consumption(start_d, end_d):
-                # Note: creating a dedicated query for each product/period might be slow if many products.
-                # Optimized approach: Filter by date range first, then group by product. 
-                # But for simplicity and robustness first:
-                query = """
-                    SELECT ABS(COALESCE(SUM(quantite), 0))
-                    FROM stock_movements
-                    WHERE product_id = ? 
-                    AND type_mouvement IN ('Vente', 'Sortie', 'Consommation') 
-                    AND quantite < 0
-                    AND date(created_at) >= ? AND date(created_at) <= ?
-                """
-                # Note: stock_movements has created_at which is timestamp. 
-                # Ideally we should use the DATE of the document (date_facture etc).
-                # But stock_movements doesn't store the document date directly, only created_at.
-                # However, for consistency with 'Situation', usually we rely on the document date.
-                # The stock_movements table has `created_at` which is usually NOW().
-                # For `stock_valuation`, I used `receptions` and `factures` tables directly.
-                # I should probably do the same here for accuracy if backdating is allowed.
-                return 0.0
-
-            # refined approach using Factures table for 'Vente' to respect `date_facture`
-            # Consumption = Ventes (Factures) + Retours (Avoirs negative impact? No, Avoir is positive stock).
-            # So Consumption is purely Sales (Factures). 
-            # Unless there are internal consumptions?
-            # User said "Consommation", usually implies Sales in this context or internal usage.
-            # verify_movement_types showed 'Vente' and 'Réception'.
-            # So strictly 'Vente'.
-            
-            def get_sales_qty(start_d, end_d):
-                 cursor.execute("""
-                    SELECT COALESCE(SUM(lf.quantite), 0)
-                    FROM lignes_facture lf
-                    JOIN factures f ON lf.facture_id = f.id
-                    WHERE lf.product_id = ? 
-                    AND f.date_facture >= ? AND f.date_facture <= ?
-                    AND f.type_document = 'Facture' 
-                    AND f.statut != 'Annulée'
-                 """, (pid, start_d, end_d))
-                 return cursor.fetchone()[0]
-
-            daily_qty = get_sales_qty(day_str, day_str)
-            monthly_qty = get_sales_qty(month_start, day_str)
-            yearly_qty = get_sales_qty(year_start, day_str)
+            daily_qty, monthly_qty, yearly_qty = qty_by_product.get(pid, (0, 0, 0))
             
             if daily_qty == 0 and monthly_qty == 0 and yearly_qty == 0:
                 continue # Skip products with no movement? Or show all? 
@@ -674,6 +605,30 @@ class BusinessLogic:
         cursor.execute("SELECT * FROM clients WHERE active = 1 ORDER BY raison_sociale")
         clients = cursor.fetchall()
         
+        # Invoices / Avoirs of every client, before 01/01 and in the year (01/01 to date_n), one scan
+        cursor.execute("""
+            SELECT client_id,
+                   COALESCE(SUM(CASE WHEN date_facture < ? AND type_document = 'Facture' THEN montant_ttc END), 0),
+                   COALESCE(SUM(CASE WHEN date_facture < ? AND type_document = 'Avoir' THEN montant_ttc END), 0),
+                   COALESCE(SUM(CASE WHEN date_facture >= ? AND type_document = 'Facture' THEN montant_ttc END), 0),
+                   COALESCE(SUM(CASE WHEN date_facture >= ? AND type_document = 'Avoir' THEN montant_ttc END), 0)
+            FROM factures
+            WHERE date_facture <= ? AND type_document IN ('Facture', 'Avoir') AND statut != 'Annulée'
+            GROUP BY client_id
+        """, (start_year_str, start_year_str, start_year_str, start_year_str, date_n))
+        factures_by_client = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+        
+        # Payments of every client, before 01/01 and in the year
+        cursor.execute("""
+            SELECT client_id,
+                   COALESCE(SUM(CASE WHEN date_paiement < ? THEN montant END), 0),
+                   COALESCE(SUM(CASE WHEN date_paiement >= ? THEN montant END), 0)
+            FROM paiements
+            WHERE date_paiement <= ?
+            GROUP BY client_id
+        """, (start_year_str, start_year_str, date_n))
+        paiements_by_client = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+        
         results = []
         
         # Totals
@@ -686,61 +641,17 @@ class BusinessLogic:
             cid = client['id']
             report_n_1 = client['report_n_moins_1'] or 0.0
             
-            # --- 1. Calculate Solde 01/01 ---
-            # Sum movements BEFORE start_year_str
-            
-            # Invoices before 01/01
-            cursor.execute("""
-                SELECT COALESCE(SUM(montant_ttc), 0) FROM factures 
-                WHERE client_id = ? AND date_facture < ? AND type_document = 'Facture' AND statut != 'Annulée'
-            """, (cid, start_year_str))
-            hist_factures = cursor.fetchone()[0]
-            
-            # Avoirs before 01/01
-            cursor.execute("""
-                SELECT COALESCE(SUM(montant_ttc), 0) FROM factures 
-                WHERE client_id = ? AND date_facture < ? AND type_document = 'Avoir' AND statut != 'Annulée'
-            """, (cid, start_year_str))
-            hist_avoirs = cursor.fetchone()[0]
-            
-            # Payments before 01/01
-            cursor.execute("""
-                SELECT COALESCE(SUM(montant), 0) FROM paiements 
-                WHERE client_id = ? AND date_paiement < ?
-            """, (cid, start_year_str))
-            hist_paiements = cursor.fetchone()[0]
+            hist_factures, hist_avoirs, achats_year, avoirs_year = factures_by_client.get(cid, (0, 0, 0, 0))
+            hist_paiements, paiements_year = paiements_by_client.get(cid, (0, 0))
             
+            # --- 1. Calculate Solde 01/01 ---
             # Solde 01/01 = Initial - (Factures - Avoirs) + Paiements
             # User Logic: Negative = Debt. Purchase increases debt ( more negative). Payment reduces debt (adds positive).
             solde_01_01 = report_n_1 - (hist_factures - hist_avoirs) + hist_paiements
             
-            # --- 2. Calculate Movements Year (01/01 to date_n) ---
-            
-            # Achats (Invoices) in range
-            cursor.execute("""
-                SELECT COALESCE(SUM(montant_ttc), 0) FROM factures 
-                WHERE client_id = ? AND date_facture >= ? AND date_facture <= ? 
-                AND type_document = 'Facture' AND statut != 'Annulée'
-            """, (cid, start_year_str, date_n))
-            achats_year = cursor.fetchone()[0]
-            
-            # Avoirs in range
-            cursor.execute("""
-                SELECT COALESCE(SUM(montant_ttc), 0) FROM factures 
-                WHERE client_id = ? AND date_facture >= ? AND date_facture <= ? 
-                AND type_document = 'Avoir' AND statut != 'Annulée'
-            """, (cid, start_year_str, date_n))
-            avoirs_year = cursor.fetchone()[0]
-            
+            # --- 2. Movements Year (01/01 to date_n) ---
             achats_net = achats_year - avoirs_year
             
-            # Paiements in range
-            cursor.execute("""
-                SELECT COALESCE(SUM(montant), 0) FROM paiements 
-                WHERE client_id = ? AND date_paiement >= ? AND date_paiement <= ?
-            """, (cid, start_year_str, date_n))
-            paiements_year = cursor.fetchone()[0]
-            
             # --- 3. Final Balance ---
             # Balance = Init - Purchases + Payments
             solde_final = solde_01_01 - achats_net + paiements_year
@@ -790,74 +701,88 @@ class BusinessLogic:
             }
         }
 
-    def calculate_client_balance(self, client_id: int) -> Dict[str, float]:
+    def calculate_client_balance(self, client_id: int) -> Dict[str, Any]:
         """
         Calculate client balance using formula:
         Solde = (Report N-1 + Σ Paiements + Σ Avoirs) - Σ Factures
         
         Returns dict with:
+        - raison_sociale: Client name
         - report: Report from previous year
         - total_paiements: Sum of all payments
         - total_avoirs: Sum of all credit notes
         - total_factures: Sum of all invoices
         - solde: Final balance (positive = available credit, negative = debt)
         """
+        return self._query_client_balances(client_id)[client_id]
+    
+    def calculate_all_client_balances(self, active_only: bool = False) -> Dict[int, Dict[str, Any]]:
+        """
+        Same balances as calculate_client_balance, for every client in one query,
+        ordered by raison_sociale, each with its 'raison_sociale'.
+        Returns {client_id: balance dict}
+        """
+        return self._query_client_balances(active_only=active_only)
+    
+    def _query_client_balances(self, client_id: Optional[int] = None,
+                               active_only: bool = False) -> Dict[int, Dict[str, Any]]:
+        """Balances of one client (client_id) or of all clients, keyed by client id"""
         conn = self.db._get_connection()
         cursor = conn.cursor()
         
-        # Get report N-1
-        cursor.execute("SELECT report_n_moins_1 FROM clients WHERE id = ?", (client_id,))
-        report = cursor.fetchone()[0] or 0.0
-        
-        # Get last closed year
-        cursor.execute("SELECT MAX(annee) FROM clotures")
-        last_closed_year = cursor.fetchone()[0]
-        
-        # If no closure, we take all history (or start_year = 0)
-        start_year = last_closed_year if last_closed_year else 0
-        
-        # Sum of payments
-        cursor.execute("""
-            SELECT COALESCE(SUM(montant), 0) FROM paiements 
-            WHERE client_id = ? AND strftime('%Y', date_paiement) > ?
-        """, (client_id, str(start_year)))
-        total_paiements = cursor.fetchone()[0]
-        
-        # Sum of credit notes (avoirs)
-        cursor.execute("""
-            SELECT COALESCE(SUM(montant_ttc), 0) FROM factures 
-            WHERE client_id = ? AND type_document = 'Avoir' AND annee > ?
-        """, (client_id, start_year))
-        total_avoirs = cursor.fetchone()[0]
-        
-        # Sum of invoices
-        cursor.execute("""
-            SELECT COALESCE(SUM(montant_ttc), 0) FROM factures 
-            WHERE client_id = ? AND type_document = 'Facture' AND annee > ?
-        """, (client_id, start_year))
-        total_factures = cursor.fetchone()[0]
-        
-        # Calculate balance
-        solde = (report + total_paiements + total_avoirs) - total_factures
-        
-        return {
-            'report': report,
-            'total_paiements': total_paiements,
-            'total_avoirs': total_avoirs,
-            'total_factures': total_factures,
-            'solde': solde
-        }
+        # One round-trip: report N-1, payments, avoirs and invoices since the last closed year
+        # (no closure -> start_year = 0, all history)
+        where, params = [], []
+        if client_id is not None:
+            where.append("c.id = ?")
+            params.append(client_id)
+        if active_only:
+            where.append("c.active = 1")
+        
+        cursor.execute(f"""
+            SELECT c.id, c.raison_sociale, c.report_n_moins_1,
+                   (SELECT COALESCE(SUM(p.montant), 0) FROM paiements p
+                    WHERE p.client_id = c.id AND p.date_paiement >= printf('%04d-01-01', y.start_year + 1)),
+                   COALESCE(SUM(CASE WHEN f.type_document = 'Avoir' THEN f.montant_ttc END), 0),
+                   COALESCE(SUM(CASE WHEN f.type_document = 'Facture' THEN f.montant_ttc END), 0)
+            FROM clients c
+            CROSS JOIN (SELECT COALESCE(MAX(annee), 0) AS start_year FROM clotures) y
+            LEFT JOIN factures f ON f.client_id = c.id AND f.annee > y.start_year
+                                AND f.type_document IN ('Avoir', 'Facture')
+            {'WHERE ' + ' AND '.join(where) if where else ''}
+            GROUP BY c.id
+            ORDER BY c.raison_sociale
+        """, params)
+        
+        balances = {}
+        for cid, raison_sociale, report, total_paiements, total_avoirs, total_factures in cursor.fetchall():
+            report = report or 0.0
+            
+            # Calculate balance
+            solde = (report + total_paiements + total_avoirs) - total_factures
+            
+            balances[cid] = {
+                'raison_sociale': raison_sociale,
+                'report': report,
+                'total_paiements': total_paiements,
+                'total_avoirs': total_avoirs,
+                'total_factures': total_factures,
+                'solde': solde
+            }
+        return balances
     
     def check_credit_limit(self, client_id: int, nouveau_montant: float) -> Tuple[bool, Dict[str, Any]]:
         """
         Check if new invoice would exceed credit limit
         Returns (is_within_limit, balance_info)
         """
-        client = self.db.get_client_by_id(client_id)
-        if not client:
+        # Only the threshold is needed here (not the whole client row)
+        conn = self.db._get_connection()
+        row = conn.execute("SELECT seuil_credit FROM clients WHERE id = ?", (client_id,)).fetchone()
+        if not row:
             return (False, {})
         
-        seuil_credit = client['seuil_credit']
+        seuil_credit = row[0]
         balance_info = self.calculate_client_balance(client_id)
         
         # Calculate future balance after this invoice
@@ -875,18 +800,26 @@ class BusinessLogic:
         
         return (is_within_limit, balance_info)
     
-    def calculate_facture_totals(self, lignes: List[Dict[str, Any]]) -> Dict[str, float]:
+    def calculate_facture_totals(self, lignes: List[Dict[str, Any]],
+                                 tva_by_product: Optional[Dict[int, float]] = None) -> Dict[str, float]:
         """
         Calculate invoice totals from line items using per-product TVA
+        A line may carry its own 'tva' (rate already known by the UI), otherwise
+        tva_by_product: {product_id: tva} already loaded by the caller (fetched otherwise)
         Returns dict with montant_ht, montant_tva, montant_ttc
         """
         montant_ht_total = 0.0
         montant_tva_total = 0.0
         
+        # TVA rates of the products without a line rate, in one query (none if all lines have one)
+        if tva_by_product is None:
+            tva_by_product = self.db.get_products_tva(
+                ligne['product_id'] for ligne in lignes if ligne.get('tva') is None)
+        
         for ligne in lignes:
-            # Fetch product to get TVA rate
-            product = self.db.get_product_by_id(ligne['product_id'])
-            tva_rate = product.get('tva', 19.0) if product else 19.0
+            tva_rate = ligne.get('tva')
+            if tva_rate is None:
+                tva_rate = tva_by_product.get(ligne['product_id'], 19.0)
             
             # ROUNDING FIX: Round at line level
             ligne_ht = round(ligne['quantite'] * ligne['prix_unitaire'], 2)
@@ -911,23 +844,23 @@ class BusinessLogic:
         For logic strictly as requested: "Montant TTC <= Restant dû" implies we should check 
         (Original Amount - Previous Avoirs).
         """
-        facture = self.db.get_facture_by_id(facture_origine_id)
-        if not facture:
-            return False
-        
-        montant_facture_ttc = facture['montant_ttc']
-        
-        # Get all existing avoirs for this invoice
+        # Remaining = original amount - all existing avoirs for this invoice (one query,
+        # no row -> original invoice not found)
         conn = self.db._get_connection()
         cursor = conn.cursor()
         cursor.execute("""
-            SELECT COALESCE(SUM(montant_ttc), 0)
-            FROM factures
-            WHERE facture_origine_id = ? AND type_document = 'Avoir' AND statut != 'Annulée'
+            SELECT f.montant_ttc - (SELECT COALESCE(SUM(a.montant_ttc), 0)
+                                    FROM factures a
+                                    WHERE a.facture_origine_id = f.id
+                                      AND a.type_document = 'Avoir' AND a.statut != 'Annulée')
+            FROM factures f
+            WHERE f.id = ?
         """, (facture_origine_id,))
-        previous_avoirs_ttc = cursor.fetchone()[0]
+        row = cursor.fetchone()
+        if not row:
+            return False
         
-        remaining = montant_facture_ttc - previous_avoirs_ttc
+        remaining = row[0]
         
         # Allow small epsilon for float comparison or exact
         return montant_avoir_ttc <= (remaining + 0.01)
@@ -959,6 +892,13 @@ class BusinessLogic:
         Create invoice with full validation
         Returns (success, message, facture_id)
         """
+        # Single clock read: contract expiry, invoice date and fiscal year stay consistent
+        now = datetime.now()
+        
+        # One connection / cursor for the whole operation
+        conn = self.db._get_connection()
+        cursor = conn.cursor()
+        
         # Validate credit note has origin
         if type_document == 'Avoir':
             if not facture_origine_id:
@@ -966,8 +906,12 @@ class BusinessLogic:
             if not motif:
                  return (False, "Un motif est obligatoire pour un avoir", None)
         
+        # Products of all lines, loaded once for this operation (TVA, stock, parent flag)
+        products = self.db.get_stocks_for_products(ligne['product_id'] for ligne in lignes)
+        
         # Calculate totals
-        totals = self.calculate_facture_totals(lignes)
+        totals = self.calculate_facture_totals(
+            lignes, {pid: p['tva'] for pid, p in products.items()})
         
         if type_document == 'Avoir':
              # Validate Avoir Amount
@@ -976,8 +920,6 @@ class BusinessLogic:
 
         # Validate Contract if linked
         if contract_id:
-            conn = self.db._get_connection()
-            cursor = conn.cursor()
             cursor.execute("SELECT date_fin, active FROM contracts WHERE id=?", (contract_id,))
             row = cursor.fetchone()
             if not row:
@@ -989,27 +931,23 @@ class BusinessLogic:
             if not active:
                 return (False, "Ce contrat n'est pas actif", None)
             
-            current_date = datetime.now().strftime("%Y-%m-%d")
+            current_date = now.strftime("%Y-%m-%d")
             if current_date > date_fin:
                 return (False, f"Le contrat est expiré depuis le {date_fin}", None)
 
         # For invoices (not credit notes), check stock and credit limit
         if type_document == 'Facture':
-            # Check stock availability
+            # Check stock availability (parent stock included)
             for ligne in lignes:
-                is_available, current_stock = self.check_stock_availability(
-                    ligne['product_id'], 
-                    ligne['quantite']
-                )
-                if not is_available:
-                    product = self.db.get_product_by_id(ligne['product_id'])
-                if not is_available:
-                    product = self.db.get_product_by_id(ligne['product_id'])
+                product = products.get(ligne['product_id'])
+                if not product:
+                    return (False, f"Produit introuvable (id {ligne['product_id']})", None)
+                current_stock = product['stock_actuel']
+                if current_stock < ligne['quantite']:
                     return (False, f"Stock insuffisant pour {product['nom']}. Stock actuel: {current_stock}", None)
                 
                 # Check if Parent Product (Blocking)
-                if self.is_parent_product(ligne['product_id']):
-                     product = self.db.get_product_by_id(ligne['product_id'])
+                if product['is_parent']:
                      return (False, f"Le produit '{product['nom']}' est un produit parent (Groupe). Impossible de le vendre directement.", None)
             
             # --- Type Vente Logic ---
@@ -1026,15 +964,12 @@ class BusinessLogic:
                 # Check credit limit
                 is_within_limit, balance_info = self.check_credit_limit(client_id, totals['montant_ttc'])
                 if not is_within_limit:
-                    client = self.db.get_client_by_id(client_id)
                     return (False, 
                            f"Seuil de crédit dépassé de {balance_info['depassement']:.2f} DA.\n\nSolde Actuel: {balance_info['solde']:.2f} DA\nSeuil: {balance_info['seuil_credit']:.2f} DA", 
                            None)
 
             elif type_vente == 'Sur Avances':
                 # Check if client has sufficient advances (Negative Solde Creance)
-                conn = self.db._get_connection()
-                cursor = conn.cursor()
                 cursor.execute("SELECT solde_creance FROM clients WHERE id = ?", (client_id,))
                 current_balance = cursor.fetchone()[0] or 0.0
                 
@@ -1065,8 +1000,8 @@ class BusinessLogic:
              statut_facture = 'Remboursée' # Or applied
 
         # Create invoice
-        current_year = datetime.now().year
-        current_date = datetime.now().strftime("%Y-%m-%d")
+        current_year = now.year
+        current_date = now.strftime("%Y-%m-%d")
         
         if custom_date:
              current_date = custom_date
@@ -1074,14 +1009,12 @@ class BusinessLogic:
                  current_year = int(custom_date.split('-')[0])
              except: pass
         
-        if type_vente == 'A terme':
-             is_ok, info = self.check_credit_limit(client_id, totals['montant_ttc'])
-             if not is_ok:
-                  return (False, f"Crédit insuffisant. Solde futur: {info['solde_futur']:.2f}, Limite: {info['seuil_credit']:.2f}", None)
+        # Credit limit ('A terme') was already checked in the validation above: not repeated here.
 
+        # Whole creation (number, invoice, lines, stock, balance, payment, avoir status)
+        # is one transaction: committed once at the end, rolled back on any error.
         try:
-            conn = self.db._get_connection()
-            cursor = conn.cursor()
+            conn.execute("BEGIN TRANSACTION")
             
             # Generate Number
             # Logic: If custom date year != current year, we should likely generate number for THAT year?
@@ -1106,46 +1039,30 @@ class BusinessLogic:
             facture_id = cursor.lastrowid
             
             # Create Lines
-            for ligne in lignes:
-                cursor.execute("""
-                    INSERT INTO lignes_facture (facture_id, product_id, quantite, prix_unitaire, montant, taux_remise, prix_initial)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (facture_id, ligne['product_id'], ligne['quantite'], ligne['prix_unitaire'], ligne['montant'], 
-                      ligne.get('taux_remise', 0.0), ligne.get('prix_initial', ligne['prix_unitaire'])))
-                
-                # Update Stock
-                # Update Stock and Log Movement
-                if type_document == 'Facture':
-                    # Sales decrease stock
-                    self.db.log_stock_movement(
-                        product_id=ligne['product_id'],
-                        type_mouvement='Vente',
-                        quantite=-ligne['quantite'],
-                        reference_document=numero,
-                        document_id=facture_id,
-                        created_by=user_id
-                    )
-                elif type_document == 'Avoir':
-                     # Returns increase stock
-                     self.db.log_stock_movement(
-                        product_id=ligne['product_id'],
-                        type_mouvement='Retour Avoir',
-                        quantite=-ligne['quantite'], # Avoir qty is negative, so negate to make positive (Stock Add)
-                        reference_document=numero,
-                        document_id=facture_id,
-                        created_by=user_id
-                    )
-
-            conn.commit()
+            cursor.executemany("""
+                INSERT INTO lignes_facture (facture_id, product_id, quantite, prix_unitaire, montant, taux_remise, prix_initial)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [
+                (facture_id, ligne['product_id'], ligne['quantite'], ligne['prix_unitaire'], ligne['montant'], 
+                 ligne.get('taux_remise', 0.0), ligne.get('prix_initial', ligne['prix_unitaire']))
+                for ligne in lignes
+            ])
+            
+            # Update Stock and Log Movements
+            # Sales decrease stock; Returns increase stock (Avoir qty is negative, so negate to make positive)
+            type_mouvement = {'Facture': 'Vente', 'Avoir': 'Retour Avoir'}.get(type_document)
+            if type_mouvement:
+                self.db.log_stock_movements_bulk([
+                    (ligne['product_id'], type_mouvement, -ligne['quantite'], numero, facture_id, user_id, None)
+                    for ligne in lignes
+                ], commit=False)
             
             # Post-Creation Logic
             if type_document == 'Facture':
                 if type_vente in ['A terme', 'Sur Avances']:
                     # Update Client Solde Creance
-                    c = conn.cursor()
-                    c.execute("UPDATE clients SET solde_creance = solde_creance + ? WHERE id = ?", 
-                              (totals['montant_ttc'], client_id))
-                    conn.commit()
+                    cursor.execute("UPDATE clients SET solde_creance = solde_creance + ? WHERE id = ?", 
+                                   (totals['montant_ttc'], client_id))
                 elif type_vente == 'Au comptant':
                      # Create Payment Record
                      self.create_payment(
@@ -1155,37 +1072,39 @@ class BusinessLogic:
                          facture_id=facture_id,
                          reference=ref_paiement,
                          banque=banque,
-                         user_id=user_id
+                         user_id=user_id,
+                         commit=False,
+                         now=now
                      )
             
             # Helper for Avoir Status Update
             if type_document == 'Avoir' and facture_origine_id:
-                 c = conn.cursor()
-                 c.execute("""
-                    SELECT COALESCE(SUM(montant_ttc), 0)
-                    FROM factures
-                    WHERE facture_origine_id = ? AND type_document = 'Avoir' AND statut != 'Annulée'
+                 # New status computed in place from the avoirs total of the original invoice
+                 # Avoirs are negative, so we use abs() to compare magnitude
+                 cursor.execute("""
+                    UPDATE factures
+                    SET statut = CASE
+                        WHEN ABS((SELECT COALESCE(SUM(a.montant_ttc), 0)
+                                  FROM factures a
+                                  WHERE a.facture_origine_id = factures.id
+                                    AND a.type_document = 'Avoir' AND a.statut != 'Annulée')
+                                 ) >= montant_ttc - 0.01
+                        THEN 'Remboursée' -- Or 'Annulée' if preferred, but usually Remboursée implies money returned
+                        ELSE 'Partiellement remboursée'
+                    END
+                    WHERE id = ?
                  """, (facture_origine_id,))
-                 total_avoirs = c.fetchone()[0]
                  
-                 facture_org = self.db.get_facture_by_id(facture_origine_id)
-                 if facture_org:
-                     new_status = 'Partiellement remboursée'
-                     # Avoirs are negative, so we use abs() to compare magnitude
-                     if abs(total_avoirs) >= (facture_org['montant_ttc'] - 0.01):
-                         new_status = 'Remboursée' # Or 'Annulée' if preferred, but usually Remboursée implies money returned
-                     
-                     c.execute("UPDATE factures SET statut = ? WHERE id = ?", (new_status, facture_origine_id))
-                     
+                 if cursor.rowcount:
                      # Decrease debt
-                     c.execute("UPDATE clients SET solde_creance = solde_creance - ? WHERE id = ?", 
-                               (totals['montant_ttc'], client_id))
-                     conn.commit()
+                     cursor.execute("UPDATE clients SET solde_creance = solde_creance - ? WHERE id = ?", 
+                                    (totals['montant_ttc'], client_id))
 
+            conn.commit()
             return (True, f"{type_document} {numero} créée avec succès", facture_id)
 
         except Exception as e:
-            # conn.rollback() # Warning: conn might be local
+            conn.rollback()
             return (False, f"Erreur base de données: {str(e)}", None)
 
     def update_invoice_draft(self, facture_id: int, new_lignes: List[Dict[str, Any]], user_id: int, **kwargs) -> Tuple[bool, str]:
@@ -1231,11 +1150,14 @@ class BusinessLogic:
              cursor.execute("DELETE FROM lignes_facture WHERE facture_id = ?", (facture_id,))
              
              # 4. Insert New Lines and Deduct Stock
-             totals = self.calculate_facture_totals(new_lignes)
+             # Products of the new lines, loaded once (TVA, parent flag)
+             products = self.db.get_stocks_for_products(ligne['product_id'] for ligne in new_lignes)
+             totals = self.calculate_facture_totals(
+                 new_lignes, {pid: p['tva'] for pid, p in products.items()})
              
              for ligne in new_lignes:
                  # Check Parent
-                 if self.is_parent_product(ligne['product_id']):
+                 if products.get(ligne['product_id'], {}).get('is_parent'):
                      raise Exception(f"Produit parent interdit: {ligne['product_id']}")
 
                  cursor.execute("""
@@ -1351,12 +1273,15 @@ class BusinessLogic:
                       facture_id: Optional[int] = None, reference: str = None,
                       banque: str = None, contrat_num: str = None,
                       contrat_date_debut: str = None, contrat_date_fin: str = None,
-                      user_id: Optional[int] = None) -> Tuple[bool, str, Optional[int]]:
+                      user_id: Optional[int] = None, commit: bool = True,
+                      now: Optional[datetime] = None) -> Tuple[bool, str, Optional[int]]:
         """
         Create payment (including advance payments without facture_id)
+        commit=False leaves the transaction open for the caller
+        now: caller's clock read (an invoice and its payment share the same date)
         Returns (success, message, paiement_id)
         """
-        current_date = datetime.now().strftime("%Y-%m-%d")
+        current_date = (now or datetime.now()).strftime("%Y-%m-%d")
         
         # Validate bank details for non-cash payments
         if mode_paiement in ['Chèque', 'Virement', 'Versement']:
@@ -1374,7 +1299,8 @@ class BusinessLogic:
             contrat_num=contrat_num,
             contrat_date_debut=contrat_date_debut,
             contrat_date_fin=contrat_date_fin,
-            created_by=user_id
+            created_by=user_id,
+            commit=False
         )
         
         # Update Client Solde Creance (Decrease debt)
@@ -1382,18 +1308,21 @@ class BusinessLogic:
         c = conn.cursor()
         c.execute("UPDATE clients SET solde_creance = solde_creance - ? WHERE id = ?", 
                   (montant, client_id))
-        conn.commit()
         
         # Update Invoice Payment Status
         if facture_id:
-             self.update_invoice_payment_status(facture_id)
+             self.update_invoice_payment_status(facture_id, commit=False)
+        
+        if commit:
+            conn.commit()
         
         return (True, "Paiement enregistré avec succès", paiement_id)
 
-    def update_invoice_payment_status(self, facture_id: int):
+    def update_invoice_payment_status(self, facture_id: int, commit: bool = True):
         """
         Recalculate and update 'etat_paiement' for a facture based on payments and total.
         Statuses: 'Comptant' (if initially so and 0 pay?), 'A Terme' (initial), 'Non soldée', 'Payée'
+        commit=False leaves the transaction open for the caller
         """
         try:
             conn = self.db._get_connection()
@@ -1428,7 +1357,8 @@ class BusinessLogic:
                     new_status = 'A Terme'
             
             c.execute("UPDATE factures SET etat_paiement = ? WHERE id = ?", (new_status, facture_id))
-            conn.commit()
+            if commit:
+                conn.commit()
             
         except Exception as e:
             print(f"Error updating payment status for {facture_id}: {e}")
@@ -1442,26 +1372,26 @@ class BusinessLogic:
         if not paiement_ids:
             return (False, "Aucun paiement sélectionné", None)
         
-        # Validate all payments are 'En attente'
-        paiements = []
-        for pid in paiement_ids:
-            conn = self.db._get_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT statut FROM paiements WHERE id = ?", (pid,))
-            row = cursor.fetchone()
-            if not row or row[0] != 'En attente':
-                return (False, f"Le paiement {pid} n'est pas en attente", None)
-            paiements.append(pid)
-        
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        
+        # Status check and deposit in one transaction: the UPDATE only moves 'En attente'
+        # payments and nothing is written unless all of them moved.
+        # Dated by SQLite (today, local time)
         bordereau_id = self.db.create_bordereau(
-            date_bordereau=current_date,
+            date_bordereau=None,
             banque=banque,
             paiement_ids=paiement_ids,
             created_by=user_id
         )
         
+        if bordereau_id is None:
+            # Rolled back: name the first payment that was not pending
+            conn = self.db._get_connection()
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT id, statut FROM paiements WHERE id IN ({','.join('?' * len(paiement_ids))})",
+                           tuple(paiement_ids))
+            statuts = dict(cursor.fetchall())
+            pid = next(pid for pid in paiement_ids if statuts.get(pid) != 'En attente')
+            return (False, f"Le paiement {pid} n'est pas en attente", None)
+        
         return (True, "Bordereau créé avec succès", bordereau_id)
     
     # ==================== ANNUAL CLOSURE ====================
@@ -1479,40 +1409,39 @@ class BusinessLogic:
         if existing:
             return (False, f"L'année {annee} est déjà clôturée")
         
-        # Calculate client balances for snapshot
-        clients = self.db.get_all_clients()
-        soldes_snapshot = {}
-        for client in clients:
-            balance = self.calculate_client_balance(client['id'])
-            soldes_snapshot[client['id']] = {
-                'raison_sociale': client['raison_sociale'],
+        # Calculate client balances for snapshot (active clients, names and balances in one query)
+        balances = self.calculate_all_client_balances(active_only=True)
+        soldes_snapshot = {
+            client_id: {
+                'raison_sociale': balance['raison_sociale'],
                 'solde': balance['solde']
             }
+            for client_id, balance in balances.items()
+        }
         
         # Create closure record with snapshots
         import json
         conn = self.db._get_connection()
         cursor = conn.cursor()
         
-        # Get stock snapshot
-        products = self.db.get_all_products()
-        stocks_snapshot = {p['id']: {'nom': p['nom'], 'stock': p['stock_actuel']} 
-                          for p in products}
-        
-        date_cloture = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # Get stock snapshot (active products, only the 3 columns stored)
+        cursor.execute("SELECT id, nom, stock_actuel FROM products WHERE active = 1 ORDER BY nom")
+        stocks_snapshot = {pid: {'nom': nom, 'stock': stock} 
+                          for pid, nom, stock in cursor.fetchall()}
         
+        # date_cloture from SQLite's clock (local time, same format as before)
         cursor.execute("""
             INSERT INTO clotures 
             (annee, date_cloture, stocks_snapshot, soldes_snapshot, created_by)
-            VALUES (?, ?, ?, ?, ?)
-        """, (annee, date_cloture, json.dumps(stocks_snapshot), 
+            VALUES (?, datetime('now', 'localtime'), ?, ?, ?)
+        """, (annee, json.dumps(stocks_snapshot), 
               json.dumps(soldes_snapshot), user_id))
         
-        conn.commit()
+        # Update client reports for next year (N+1), same transaction as the closure record
+        cursor.executemany("UPDATE clients SET report_n_moins_1 = ? WHERE id = ?",
+                           [(data['solde'], client_id) for client_id, data in soldes_snapshot.items()])
         
-        # Update client reports for next year (N+1)
-        for client_id, data in soldes_snapshot.items():
-            self.db.update_client(client_id, report_n_moins_1=data['solde'])
+        conn.commit()
         
         return (True, f"Clôture de l'année {annee} effectuée avec succès")
     
@@ -1531,37 +1460,43 @@ class BusinessLogic:
             return {}
         
         balance = self.calculate_client_balance(client_id)
-        factures = self.db.get_all_factures(client_id=client_id)
-        paiements = self.db.get_all_paiements(client_id=client_id)
+        # Only the last 10 rows are fetched (LIMIT in SQL, not a slice of the full history)
+        factures = self.db.get_all_factures(client_id=client_id, limit=10)
+        paiements = self.db.get_all_paiements(client_id=client_id, limit=10)
         
         return {
             'client': client,
             'balance': balance,
-            'factures': factures[:10],  # Last 10 invoices
-            'paiements': paiements[:10]  # Last 10 payments
+            'factures': factures,  # Last 10 invoices
+            'paiements': paiements  # Last 10 payments
         }
     
     def get_stock_report(self) -> List[Dict[str, Any]]:
         """Get stock report with movements"""
         products = self.db.get_all_products()
+        # Last 5 movements of every product, one query
+        recent = self.db.get_recent_stock_movements(per_product=5)
         report = []
         
         for product in products:
-            movements = self.db.get_stock_movements(product['id'])
             report.append({
                 'product': product,
-                'recent_movements': movements[:5]  # Last 5 movements
+                'recent_movements': recent.get(product['id'], [])
             })
         
         return report
 
-    def get_daily_sales_stats(self, report_date: str) -> Dict[str, Any]:
+    def get_daily_sales_stats(self, report_date: str, include_product_stats: bool = True,
+                              product_ids: Optional[List[int]] = None,
+                              include_details: bool = True) -> Dict[str, Any]:
         """
         Get statistics for Daily Sales Report:
         1. Detailed invoices/avoirs for the specific date.
         2. Per-product daily quantity (on report_date).
         3. Per-product cumulative quantity (Jan 1st to report_date).
         FILTERS OUT: Fully refunded invoices and their cancelling Avoirs to show only "Real Sales".
+        include_product_stats=False skips the per-product section (product_stats is empty),
+        product_ids restricts it to those products, include_details=False leaves details empty.
         """
         conn = self.db._get_connection()
         cursor = conn.cursor()
@@ -1584,7 +1519,8 @@ class BusinessLogic:
             ORDER BY f.numero
         """, (report_date,))
         
-        raw_rows = [dict(row) for row in cursor.fetchall()]
+        # sqlite3.Row as is: named access for the refund checks, unpacked in the totals loop
+        raw_rows = cursor.fetchall()
         
         # --- LOGIC TO FILTER REFUNDED TRANSACTIONS ---
         # We need to identify invoices that are fully Refunded/Cancelled
@@ -1595,27 +1531,34 @@ class BusinessLogic:
         
         hidden_invoice_ids = set()
         
-        # Helper to check if invoice is fully refunded
-        def is_fully_refunded(facture_id, total_ttc):
-            # Sum Avoirs for this invoice
-            cursor.execute("""
-                SELECT COALESCE(SUM(montant_ttc), 0)
+        # Candidates: refunded (or partially refunded) invoices of the day
+        refunded_ttc = {
+            r['facture_id']: r['montant_ttc'] for r in raw_rows
+            if r['type_document'] == 'Facture'
+            and ('Remboursée' in r['statut'] or r['statut'] == 'Partiellement remboursée')
+        }
+        
+        # Sum Avoirs of all candidates in one query
+        avoirs_by_facture = {}
+        if refunded_ttc:
+            cursor.execute(f"""
+                SELECT facture_origine_id, COALESCE(SUM(montant_ttc), 0)
                 FROM factures
-                WHERE facture_origine_id = ? AND type_document = 'Avoir' AND statut != 'Annulée'
-            """, (facture_id,))
-            total_av = cursor.fetchone()[0]
+                WHERE facture_origine_id IN ({','.join('?' * len(refunded_ttc))})
+                AND type_document = 'Avoir' AND statut != 'Annulée'
+                GROUP BY facture_origine_id
+            """, tuple(refunded_ttc))
+            avoirs_by_facture = dict(cursor.fetchall())
+
+        # First pass: Check Invoices
+        # Check status. Also check if we just missed the status update but sums match
+        for facture_id, total_ttc in refunded_ttc.items():
+            total_av = avoirs_by_facture.get(facture_id, 0)
             # CHECK ABSOLUTE VALUE
             # Avoirs are negative, invoices positive. 
             # If abs(total_av) >= invoice_ttc, it's fully refunded.
-            return abs(total_av) >= (total_ttc - 0.5)
-
-        # First pass: Check Invoices
-        for r in raw_rows:
-            if r['type_document'] == 'Facture':
-                # Check status. Also check if we just missed the status update but sums match
-                if 'Remboursée' in r['statut'] or r['statut'] == 'Partiellement remboursée':
-                    if is_fully_refunded(r['facture_id'], r['montant_ttc']):
-                        hidden_invoice_ids.add(r['facture_id'])
+            if abs(total_av) >= (total_ttc - 0.5):
+                hidden_invoice_ids.add(facture_id)
 
         # Second pass: Check Avoirs
         # If Avoir points to a hidden invoice, hide it too
@@ -1635,19 +1578,18 @@ class BusinessLogic:
         # We need to recalculate daily product stats based on the filtered list
         filtered_daily_product_qty = {} 
 
-        for r in raw_rows:
-            if r['facture_id'] in hidden_invoice_ids:
+        for (qty, ht, facture_id, numero, date_facture, type_document, _statut, _montant_ttc,
+             _facture_origine_id, code_client, raison_sociale, product_nom, code_produit,
+             tva_rate, pid) in raw_rows:
+            if facture_id in hidden_invoice_ids:
                 continue
             
-            qty = r['quantite']
-            ht = r['montant_ht']
-            tva_rate = r['tva']
             tva_amount = ht * (tva_rate / 100)
             ttc = ht + tva_amount
             
             # Determine sign based on document type
             # Use strict type check
-            is_avoir = (r['type_document'] == 'Avoir')
+            is_avoir = (type_document == 'Avoir')
             sign = -1 if is_avoir else 1
             
             # Add to totals (using sign)
@@ -1657,18 +1599,20 @@ class BusinessLogic:
             total_day_qty += (qty * sign)
             
             # Add to product stats
-            pid = r['product_id']
             if pid not in filtered_daily_product_qty:
                 filtered_daily_product_qty[pid] = 0.0
             filtered_daily_product_qty[pid] += (qty * sign)
             
+            if not include_details:
+                continue
+            
             details.append({
-                'code_client': r['code_client'],
-                'client': r['raison_sociale'],
-                'code_produit': r['code_produit'],
-                'produit': r['product_nom'],
-                'facture_num': r['numero'],
-                'date': r['date_facture'],
+                'code_client': code_client,
+                'client': raison_sociale,
+                'code_produit': code_produit,
+                'produit': product_nom,
+                'facture_num': numero,
+                'date': date_facture,
                 'qte': qty * sign,         # Display negative for Avoirs if shown
                 'ht': ht * sign,
                 'tva': tva_amount * sign,
@@ -1683,33 +1627,44 @@ class BusinessLogic:
         # Recalculating fully refunded for the whole year is expensive. 
         # We stick to standard query for cumulative, but use filtered for daily.
         
-        products = self.db.get_all_products()
         product_stats = []
         
-        for p in products:
-            pid = p['id']
-            
-            # Daily Qty from filtered list
-            net_daily_qty = filtered_daily_product_qty.get(pid, 0.0)
-            
-            
-            # Cumulative Qty (Start of Year to Report Date Included)
+        if include_product_stats:
+            # Cumulative Qty (Start of Year to Report Date Included), all products in one scan
             # Since Avoirs are negative in DB, we just SUM everything
-            cursor.execute("""
-                SELECT COALESCE(SUM(l.quantite), 0)
+            # (CROSS JOIN keeps lignes_facture as the outer loop: one pass, invoice looked up by id)
+            query = """
+                SELECT l.product_id, COALESCE(SUM(l.quantite), 0)
                 FROM lignes_facture l
-                JOIN factures f ON l.facture_id = f.id
-                WHERE l.product_id = ? 
-                AND f.date_facture BETWEEN ? AND ?
+                CROSS JOIN factures f ON l.facture_id = f.id
+                WHERE f.date_facture BETWEEN ? AND ?
                 AND f.statut != 'Annulée'
-            """, (pid, start_of_year, report_date))
-            net_cumul_qty = cursor.fetchone()[0]
+            """
+            params = [start_of_year, report_date]
+            if product_ids is not None:
+                query += f" AND l.product_id IN ({','.join('?' * len(product_ids))})"
+                params.extend(product_ids)
+            query += " GROUP BY l.product_id"
+            cursor.execute(query, params)
+            cumul_by_product = dict(cursor.fetchall())
+            
+            products = self.db.get_all_products()
+            if product_ids is not None:
+                wanted = set(product_ids)
+                products = [p for p in products if p['id'] in wanted]
             
-            product_stats.append({
-                'nom': p['nom'],
-                'daily_qty': net_daily_qty,
-                'cumul_qty': net_cumul_qty
-            })
+            for p in products:
+                pid = p['id']
+                
+                # Daily Qty from filtered list
+                net_daily_qty = filtered_daily_product_qty.get(pid, 0.0)
+                net_cumul_qty = cumul_by_product.get(pid, 0)
+                
+                product_stats.append({
+                    'nom': p['nom'],
+                    'daily_qty': net_daily_qty,
+                    'cumul_qty': net_cumul_qty
+                })
             
         # Calculate Yearly Global Turnover (Net)
         # Just SUM all amounts (Avoirs are negative)
@@ -1757,23 +1712,24 @@ class BusinessLogic:
             OFFSET_X = " " * 5  # Left margin
             OFFSET_Y = 3        # Top margin lines
             
-            # Construct text content
-            content = "\n" * OFFSET_Y
-            content += f"{OFFSET_X}{'Date:':<10} {date_str:<20} {'N°:':<5} {numero}\n"
-            content += f"{OFFSET_X}{'Client:':<10} {client_nom}\n"
-            content += "\n" * 2 # Spacing before items
+            # Construct text content (fragments joined once)
+            parts = ["\n" * OFFSET_Y]
+            parts.append(f"{OFFSET_X}{'Date:':<10} {date_str:<20} {'N°:':<5} {numero}\n")
+            parts.append(f"{OFFSET_X}{'Client:':<10} {client_nom}\n")
+            parts.append("\n" * 2) # Spacing before items
             
-            content += f"{OFFSET_X}{'Produit':<30} {'Qté':>10} {'Unité':>10}\n"
-            content += f"{OFFSET_X}{'-'*50}\n"
+            parts.append(f"{OFFSET_X}{'Produit':<30} {'Qté':>10} {'Unité':>10}\n")
+            parts.append(f"{OFFSET_X}{'-'*50}\n")
             
             for ligne in facture['lignes']:
                 prod_nom = ligne['product_nom'][:30]
                 qte = f"{ligne['quantite']:.2f}"
                 unite = ligne['unite']
-                content += f"{OFFSET_X}{prod_nom:<30} {qte:>10} {unite:>10}\n"
+                parts.append(f"{OFFSET_X}{prod_nom:<30} {qte:>10} {unite:>10}\n")
                 
-            content += f"{OFFSET_X}{'-'*50}\n"
-            content += "\f" # Form Feed
+            parts.append(f"{OFFSET_X}{'-'*50}\n")
+            parts.append("\f") # Form Feed
+            payload = "".join(parts).encode('cp1252', errors='replace') # simple encoding
             
             # Print
             if not printer_name:
@@ -1784,7 +1740,7 @@ class BusinessLogic:
                 hJob = win32print.StartDocPrinter(hPrinter, 1, ("Bon de Livraison", None, "RAW"))
                 try:
                     win32print.StartPagePrinter(hPrinter)
-                    win32print.WritePrinter(hPrinter, content.encode('cp1252', errors='replace')) # simple encoding
+                    win32print.WritePrinter(hPrinter, payload)
                     win32print.EndPagePrinter(hPrinter)
                 finally:
                     win32print.EndDocPrinter(hPrinter)
@@ -1813,7 +1769,7 @@ class BusinessLogic:
                 p.unite,
                 SUM(lf.quantite) as qte,
                 SUM(lf.montant) as montant_ht
-            FROM lines_facture lf
+            FROM lignes_facture lf
             JOIN factures f ON lf.facture_id = f.id
             JOIN products p ON lf.product_id = p.id
             WHERE f.date_facture BETWEEN ? AND ?
@@ -1822,9 +1778,6 @@ class BusinessLogic:
             ORDER BY cat, p.nom
         """
         
-        # 'lignes_facture' is the correct table name
-        query = query.replace("lines_facture", "lignes_facture")
-        
         c.execute(query, (start_date, end_date))
         rows = c.fetchall()
         
@@ -1860,7 +1813,31 @@ class BusinessLogic:
         clients = self.db.get_all_clients(active_only=True)
         export_data = []
         
-        current_year = datetime.now().year # Or use logic similar to calculate_client_balance
+        # Payment Breakdown
+        # We want all payments, no date filter mentioned, likely "Current State"
+        # One grouped query for every client instead of one per client
+        c.execute("""
+            SELECT client_id, mode_paiement, SUM(montant)
+            FROM paiements
+            GROUP BY client_id, mode_paiement
+        """)
+        payments_by_client = {}
+        for client_id, mode, montant in c.fetchall():
+            payments_by_client.setdefault(client_id, []).append((mode, montant))
+        
+        # Factures & Avoirs (hors annulées), same grouping
+        c.execute("""
+            SELECT client_id, type_document, SUM(montant_ttc)
+            FROM factures
+            WHERE statut != 'Annulée'
+            GROUP BY client_id, type_document
+        """)
+        documents_by_client = {}
+        for client_id, doc_type, amount in c.fetchall():
+            documents_by_client.setdefault(client_id, []).append((doc_type, amount))
+        
+        # Solde Actuel: same balances as calculate_client_balance, in one query
+        balances = self.calculate_all_client_balances(active_only=True)
         
         for client in clients:
             client_id = client['id']
@@ -1871,32 +1848,14 @@ class BusinessLogic:
                 'report_n_moins_1': client['report_n_moins_1']
             }
             
-            # Payment Breakdown
-            # We want all payments, no date filter mentioned, likely "Current State"
-            # But normally logic.calculate_client_balance filters by closure year.
-            # Here we follow the global balance logic for consistency.
-            
-            # 1. Get total payments breakdown
+            # 1. Total payments breakdown
             payments_breakdown = {'Chèque': 0.0, 'Versement': 0.0, 'Virement': 0.0, 'Global': 0.0}
             
-            c.execute("""
-                SELECT mode_paiement, SUM(montant)
-                FROM paiements 
-                WHERE client_id = ?
-                GROUP BY mode_paiement
-            """, (client_id,))
-            
-            rows = c.fetchall()
-            for r in rows:
-                mode, montant = r[0], r[1]
+            for mode, montant in payments_by_client.get(client_id, []):
                 if mode in payments_breakdown:
                     payments_breakdown[mode] = montant
-                else:
-                    # Map other modes if any (Espèces, etc) or ignore? 
-                    # User asked for specific columns but "Total Paiements Global" should include everything?
-                    # "total des paiements (cheque) total des paiements (versements) + total des paiement (virements) + (total des paiements cheque+versements+cheques)"
-                    # Typically "Global" implies sum of ALL.
-                    pass
+                # Other modes (Espèces, ...) have no column but still count in "Global"
+                # "total des paiements (cheque) total des paiements (versements) + total des paiement (virements) + (total des paiements cheque+versements+cheques)"
                 payments_breakdown['Global'] += montant
 
             data.update({
@@ -1906,46 +1865,23 @@ class BusinessLogic:
                 'paiements_global': payments_breakdown['Global']
             })
             
-            # Factures & Avoirs
             # Net Sales = Sum(Factures TTC) - Sum(Abs(Avoirs TTC))
-            c.execute("""
-                SELECT type_document, SUM(montant_ttc)
-                FROM factures
-                WHERE client_id = ? AND statut != 'Annulée'
-                GROUP BY type_document
-            """, (client_id,))
-            
-            rows = c.fetchall()
             total_factures = 0.0
             total_avoirs = 0.0
             
-            for r in rows:
-                doc_type, amount = r[0], r[1]
+            for doc_type, amount in documents_by_client.get(client_id, []):
                 if doc_type == 'Facture':
                     total_factures = amount
                 elif doc_type == 'Avoir':
-                    # Amount is stored as negative or positive? 
-                    # create_facture inserts positive amounts? 
-                    # Let's check schema/insertion. 
-                    # logic.py Line 706 calculates totals. 
-                    # ui.py usually passes positive quantites for Avoir but logic converts stock.
-                    # Standard logic: Invoice Amount is Positive. Avoir Amount is Positive (magnitude).
-                    # Avoirs usually have type_document='Avoir'.
+                    # Avoir amounts may be stored signed: take the magnitude
                     total_avoirs = abs(amount) 
 
             # User Request: "Total Factures TTC (les factures et leurs avoirs doivent etre considerés comme 0)"
             # Meaning Net Sales.
-            # Assuming Avoirs cancel Factures.
-            
             net_sales = total_factures - total_avoirs
             data['factures_net_ttc'] = net_sales
             
-            # Solde Actuel
-            # Standard Formula: (Report + Paiements + Avoirs_Credit_Value) - Factures
-            # Or simplified: (Report + Paiements) - Net_Sales (mathematically equivalent if Avoirs used correctly)
-            # Let's use the robust function
-            balance_info = self.calculate_client_balance(client_id)
-            data['solde_actuel'] = balance_info['solde']
+            data['solde_actuel'] = balances[client_id]['solde']
             
             export_data.append(data)
             
@@ -1,8 +1,8 @@
-from database import DatabaseManager
+from database import get_db
 from datetime import datetime
 
 print("Starting Date Migration...")
-db = DatabaseManager()
+db = get_db()
 conn = db._get_connection()
 cursor = conn.cursor()
 
@@ -1,9 +1,9 @@
 
 import sqlite3
-from database import DatabaseManager
+from database import get_db
 
 def repair_avoir_signs():
-    db = DatabaseManager()
+    db = get_db()
     conn = db._get_connection()
     c = conn.cursor()
     
@@ -1,16 +1,14 @@
 
-import sqlite3
+from db_utils import get_conn, get_db_path
 import os
 
-DB_NAME = 'gestion_commerciale.db'
 
 def repair_statuses():
-    if not os.path.exists(DB_NAME):
-        print(f"Database {DB_NAME} not found.")
+    if not os.path.exists(get_db_path()):
+        print(f"Database {get_db_path()} not found.")
         return
 
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+    conn = get_conn()
     c = conn.cursor()
 
     print("Checking for invoices with incorrect statuses...")
@@ -52,7 +50,6 @@ def repair_statuses():
             repaired_count += 1
             
     conn.commit()
-    conn.close()
     print(f"Repair complete. {repaired_count} invoices updated.")
 
 if __name__ == "__main__":
@@ -1,16 +1,15 @@
 
 import sqlite3
 import os
+from db_utils import get_conn, get_db_path
 
-DB_PATH = "gestion_commerciale.db"
 
 def reset_db_except_receptions():
-    if not os.path.exists(DB_PATH):
-        print(f"Database not found at {DB_PATH}")
+    if not os.path.exists(get_db_path()):
+        print(f"Database not found at {get_db_path()}")
         return
 
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = get_conn()
     cursor = conn.cursor()
 
     try:
@@ -83,8 +82,6 @@ def reset_db_except_receptions():
     except Exception as e:
         print(f"CRITICAL ERROR: {e}")
         conn.rollback()
-    finally:
-        conn.close()
 
 if __name__ == "__main__":
     reset_db_except_receptions()
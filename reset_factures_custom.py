@@ -1,7 +1,7 @@
 import sqlite3
 import os
 from database import get_db
-from logic import BusinessLogic
+from logic import get_logic
 
 def reset_factures():
     print("Starting Invoices Reset...")
@@ -66,7 +66,7 @@ def reset_factures():
 
     # 7. Recalculate Stock
     print("- Recalculating stock...")
-    bl = BusinessLogic()
+    bl = get_logic()
     try:
         stats = bl.recalculate_global_stock()
         print(f"  Stock Recalculated: {stats}")
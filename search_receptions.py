@@ -1,10 +1,8 @@
-import sqlite3
+from db_utils import get_conn
 
-DB_PATH = "gestion_commerciale.db"
 
 def search_receptions():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = get_conn(read_only=True)
     cursor = conn.cursor()
     
     print("Searching ALL columns in Receptions for 'None' or '(None)'...")
@@ -30,7 +28,6 @@ def search_receptions():
     if found_count == 0:
         print("No matches found for 'None' in any column.")
 
-    conn.close()
 
 if __name__ == "__main__":
     search_receptions()
@@ -1587,13 +1587,13 @@ class InvoicesFrame(ttk.Frame):
             InvoiceDialog(self.app.root, self.app, facture_data.get('type_document', 'Facture'), readonly=is_readonly, facture_id=facture_id)
     
     def export_excel(self):
-        factures = self.app.db.get_all_factures()
         filename = filedialog.asksaveasfilename(
             defaultextension=".xlsx",
             filetypes=[("Excel files", "*.xlsx")]
         )
         if filename:
-            export_factures_to_excel(factures, filename)
+            # Stream rows straight into the workbook instead of materializing the list
+            export_factures_to_excel(self.app.db.iter_all_factures(), filename)
             messagebox.showinfo("Succès", "Export Excel effectué")
             
     def show_reports_menu(self):
@@ -4815,7 +4815,8 @@ class InvoiceDialog:
             'prix_unitaire': price, # Net Price (Calculated)
             'montant': total,
             'prix_initial': prix_initial, # New
-            'taux_remise': taux_remise    # New
+            'taux_remise': taux_remise,   # New
+            'tva': product_tva            # Known rate: no TVA lookup when computing totals
         })
         self.tree.insert("", tk.END, values=(
             product.get('code_produit', product['nom']),
@@ -7,7 +7,7 @@ import os
 import sys
 import shutil
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable
 from reportlab.lib import colors
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter, A4, landscape
@@ -556,7 +556,7 @@ def export_clients_to_excel(clients: List[Dict[str, Any]], filename: str):
     return filename
 
 
-def export_factures_to_excel(factures: List[Dict[str, Any]], filename: str):
+def export_factures_to_excel(factures: Iterable[Dict[str, Any]], filename: str):
     "Export invoices to Excel"
     wb = Workbook()
     ws = wb.active
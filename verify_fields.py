@@ -1,6 +1,6 @@
-from database import DatabaseManager
+from database import get_db
 
-db = DatabaseManager()
+db = get_db()
 # Invoice 5 was created in verify_contracts.py linked to a contract
 inv = db.get_facture_by_id(5)
 
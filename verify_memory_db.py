@@ -0,0 +1,37 @@
+import sys
+import os
+
+# Ensure we can import from current directory
+sys.path.append(os.getcwd())
+
+# In-memory database: must not touch the real file nor try to create a directory
+os.environ["GICA_DB"] = ":memory:"
+
+try:
+    from database import DatabaseManager
+
+    print("Initializing DatabaseManager with GICA_DB=':memory:'...")
+    db = DatabaseManager()
+    assert db.db_path == ":memory:", f"Unexpected path: {db.db_path}"
+    print("DatabaseManager initialized successfully.")
+
+    # Self-healing must have built the schema in RAM
+    conn = db._get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='clients'")
+    assert cursor.fetchone(), "Table 'clients' not found"
+    print("Table 'clients' verified.")
+
+    # A bare file name (no directory part) must not crash either
+    db_file = DatabaseManager("verify_memory_db_test.db")
+    db_file._get_connection().close()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists("verify_memory_db_test.db" + suffix):
+            os.remove("verify_memory_db_test.db" + suffix)
+    print("Bare file name verified.")
+
+    print("In-Memory Database Verification Passed ✅")
+
+except Exception as e:
+    print(f"Error during verification: {e}")
+    sys.exit(1)